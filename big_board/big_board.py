@@ -1,66 +1,106 @@
-from pathlib import Path, PurePath
+from pathlib import Path
 
 display_dir = Path(__file__).parent
 board_path = display_dir / 'board.txt'
 numbers_dir = display_dir / 'numbers'
-board = open(board_path, 'r').read().split("\n")
-big_cells = {str(child.name).split('.')[0]: open(child, 'r').read() for child in numbers_dir.iterdir()}
+board = None
+big_cells = None
+template = None
+_renderer = None
 
 
-def render(puzzle_cells, no_hints=False):
-    puzzle_lookup = {f"{cell.row}{cell.col}": cell for cell in puzzle_cells}
-    big_board_str = ""
-    last_cell_id = None
-    last_line_number = None
-    for line_number, char_number, char in _iterate_board(board):
-        if line_number != last_line_number and last_line_number != None:
-            big_board_str += '\n'
-        last_line_number = line_number
-        if char != ' ':
-            big_board_str += char
-            continue
-        cell_row, cell_col, big_rows = _get_cell_id(puzzle_cells, line_number, char_number)
-        cell_id = f"{cell_row}{cell_col}"
-        if cell_id == last_cell_id:
-            continue
-        cell = puzzle_lookup[cell_id]
-        glyph = _get_glyph(cell, no_hints)
-        glyph_chunk = _get_glyph_chunk(line_number, big_rows, glyph)
-        big_board_str += glyph_chunk
-        last_cell_id = cell_id
-    return big_board_str
+def _load():
+    # The layout and glyph files are read, and the layout compiled, on the first render rather than at import.
+    global board, big_cells, template
+    if board is None:
+        board = open(board_path, 'r').read().split("\n")
+        big_cells = {str(child.name).split('.')[0]: open(child, 'r').read().split("\n") for child in numbers_dir.iterdir()}
+        template = _compile_template(board)
 
 
-def _iterate_board(board):
+def _compile_template(board):
+    # Splits every layout line into literal text and (cell index, glyph row) slots. Returns the
+    # lines as lists of parts, plus for each cell the (line, part) positions its glyph rows fill.
+    lines = []
+    cell_slots = [[] for _ in range(81)]
     for line_number, line in enumerate(board):
-        for char_number, char, in enumerate(line):
-            yield (line_number, char_number, char)
+        if not line:
+            continue
+        parts = []
+        last_cell_id = None
+        for char_number, char in enumerate(line):
+            if char != ' ':
+                if parts and last_cell_id is None:
+                    parts[-1] += char
+                else:
+                    parts.append(char)
+                last_cell_id = None
+                continue
+            cell_row, big_rows = row_lookup[line_number]
+            cell_id = (cell_row - 1) * 9 + col_lookup[char_number] - 1
+            if cell_id == last_cell_id:
+                continue
+            cell_slots[cell_id].append((len(lines), len(parts), big_rows.index(line_number)))
+            parts.append('')
+            last_cell_id = cell_id
+        lines.append(parts)
+    return (lines, cell_slots)
 
 
-def _get_cell_id(puzzle_cells, line_number, char_number):
-    cell_row, big_rows = row_lookup[line_number]
-    cell_col = col_lookup[char_number]
-    return (cell_row, cell_col, big_rows)
+def render(puzzle_cells, no_hints=False):
+    values = []
+    candidates = []
+    for cell in puzzle_cells:
+        values.append(int(cell.value) if cell.value else 0)
+        candidates.append(sum(1 << (int(value) - 1) for value in '123456789' if value not in cell.impossible_values))
+    return render_grid(values, candidates, no_hints)
 
 
-def _get_glyph(cell, no_hints):
-    if cell.value:
-        glyph = big_cells[cell.value]
-    elif no_hints:
-        glyph = big_cells['no_hints']
-    else:
-        chars_to_replace = ''.join(cell.impossible_values)
-        trans = str.maketrans(chars_to_replace, ''.join([' ' for i in range(len(chars_to_replace))]))
-        glyph = str.translate(big_cells['empty'], trans)
-    return glyph
+def render_grid(values, candidates, no_hints=False):
+    global _renderer
+    if _renderer is None:
+        _renderer = BoardRenderer()
+    return _renderer.render(values, candidates, no_hints)
 
 
-def _get_glyph_chunk(line_number, big_rows, glyph):
-    glyph_rows = glyph.split("\n")
-    for rel_row, row in enumerate(big_rows):
-        if row != line_number:
-            continue
-        return glyph_rows[rel_row]
+class BoardRenderer:
+    # Keeps the last frame so each render only rebuilds the cells, and the lines, that changed.
+
+    def __init__(self):
+        _load()
+        lines, self.cell_slots = template
+        self.lines = [list(parts) for parts in lines]
+        self.rendered_lines = [''.join(parts) for parts in lines]
+        self.cell_keys = [None] * 81
+        self.glyphs = {}
+
+    def render(self, values, candidates, no_hints=False):
+        dirty_lines = set()
+        for cell_id in range(81):
+            key = (values[cell_id], 0 if values[cell_id] or no_hints else candidates[cell_id], no_hints)
+            if key == self.cell_keys[cell_id]:
+                continue
+            self.cell_keys[cell_id] = key
+            glyph = self.glyph(*key)
+            for line_number, part, glyph_row in self.cell_slots[cell_id]:
+                self.lines[line_number][part] = glyph[glyph_row]
+                dirty_lines.add(line_number)
+        for line_number in dirty_lines:
+            self.rendered_lines[line_number] = ''.join(self.lines[line_number])
+        return '\n'.join(self.rendered_lines)
+
+    def glyph(self, value, mask, no_hints):
+        key = (value, mask, no_hints)
+        if key not in self.glyphs:
+            if value:
+                self.glyphs[key] = big_cells[str(value)]
+            elif no_hints:
+                self.glyphs[key] = big_cells['no_hints']
+            else:
+                chars_to_replace = ''.join(str(v) for v in range(1, 10) if not mask & (1 << (v - 1)))
+                trans = str.maketrans(chars_to_replace, ' ' * len(chars_to_replace))
+                self.glyphs[key] = [row.translate(trans) for row in big_cells['empty']]
+        return self.glyphs[key]
 
 
 row_lookup = {}
@@ -0,0 +1,119 @@
+import os
+import sys
+import argparse
+import threading
+from multiprocessing import Pool
+from sudoku_solver import solve
+
+
+def solve_line(line, time_budget=None):
+    try:
+        return solve(line, time_budget=time_budget).solution
+    except ValueError as exc:
+        return f"error: {exc}"
+
+
+def read_puzzles(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def solve_stream(puzzles, workers=None, chunksize=64, ordered=True, vectorized=False):
+    # Yields (index, result) pairs. Results come back in input order unless ordered is False,
+    # in which case each one is yielded as soon as its chunk finishes. With vectorized, each chunk
+    # is solved together by sudoku_vector, which needs numpy.
+    if vectorized:
+        yield from solve_chunks(puzzles, workers, chunksize, ordered)
+        return
+    if workers == 1:
+        yield from enumerate(map(solve_line, puzzles))
+        return
+    workers = workers or os.cpu_count() or 1
+    with Pool(workers) as pool:
+        # The pool pulls tasks from its input on a helper thread; bounding the number of puzzles in
+        # flight keeps memory flat when the input is a stream of millions of lines.
+        in_flight = threading.BoundedSemaphore(max(chunksize, 1) * (workers + 1) * 2)
+
+        def throttled():
+            for item in enumerate(puzzles):
+                in_flight.acquire()
+                yield item
+
+        imap = pool.imap if ordered else pool.imap_unordered
+        for index, result in imap(_solve_indexed, throttled(), chunksize):
+            in_flight.release()
+            yield (index, result)
+
+
+def _solve_indexed(item):
+    index, line = item
+    return (index, solve_line(line))
+
+
+def solve_chunks(puzzles, workers=None, chunksize=64, ordered=True):
+    chunks = read_chunks(puzzles, chunksize)
+    if workers == 1:
+        for chunk in map(_solve_chunk, chunks):
+            yield from chunk
+        return
+    workers = workers or os.cpu_count() or 1
+    with Pool(workers) as pool:
+        in_flight = threading.BoundedSemaphore((workers + 1) * 2)
+
+        def throttled():
+            for chunk in chunks:
+                in_flight.acquire()
+                yield chunk
+
+        imap = pool.imap if ordered else pool.imap_unordered
+        for chunk in imap(_solve_chunk, throttled()):
+            in_flight.release()
+            yield from chunk
+
+
+def read_chunks(puzzles, chunksize):
+    # Yields (index of first puzzle, list of puzzles) for consecutive chunks of the input.
+    chunk = []
+    start = 0
+    for line in puzzles:
+        chunk.append(line)
+        if len(chunk) == chunksize:
+            yield (start, chunk)
+            start += len(chunk)
+            chunk = []
+    if chunk:
+        yield (start, chunk)
+
+
+def _solve_chunk(item):
+    from sudoku_vector import solve_lines
+    start, lines = item
+    return list(enumerate(solve_lines(lines), start))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Solve one puzzle per line, one character per cell, from a file or stdin.")
+    parser.add_argument('--input', type=str, default='-', help="puzzle file, or - for stdin")
+    parser.add_argument('--output', type=str, default='-', help="result file, or - for stdout")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--chunksize', type=int, default=64, help="puzzles sent to a worker at a time")
+    parser.add_argument('--vectorized', action='store_true', help="solve each chunk as one numpy batch (try a chunksize in the thousands)")
+    parser.add_argument('--unordered', action='store_true', help="write results as they finish, prefixed by input line index")
+    opts = parser.parse_args(args)
+
+    in_stream = sys.stdin if opts.input == '-' else open(opts.input, 'r')
+    out_stream = sys.stdout if opts.output == '-' else open(opts.output, 'w')
+    try:
+        for index, result in solve_stream(read_puzzles(in_stream), opts.workers, opts.chunksize, not opts.unordered, opts.vectorized):
+            out_stream.write(f"{index} {result}\n" if opts.unordered else f"{result}\n")
+    finally:
+        if in_stream is not sys.stdin:
+            in_stream.close()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import re
+import sys
+import json
+import random
+import argparse
+import platform
+import statistics
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+from sudoku_solver import SudokuSolver, board_for
+from sudoku_generator import benchmark as generator_benchmark
+
+puzzles_dir = Path(__file__).parent / 'puzzles'
+
+
+def puzzle_tier(name):
+    return re.sub(r'(_puzzle)?_\d+$', '', name)
+
+
+def load_puzzles(corpus_paths=(), generated=0, seed=0, large=0):
+    # Yields (name, tier, puzzle line) for every puzzles/*.txt file, every line of each corpus file,
+    # `generated` shuffled copies of each puzzles/*.txt file, and `large` random 16x16 and 25x25 puzzles.
+    rng = random.Random(seed)
+    bundled = []
+    for path in sorted(puzzles_dir.glob('*.txt')):
+        bundled.append((path.stem, puzzle_tier(path.stem), path.read_text().strip()))
+    yield from bundled
+    for corpus_path in corpus_paths:
+        corpus_path = Path(corpus_path)
+        with open(corpus_path, 'r') as corpus:
+            for line_number, line in enumerate(corpus, 1):
+                line = line.strip()
+                if line:
+                    yield (f"{corpus_path.stem}:{line_number}", corpus_path.stem, line)
+    for copy in range(generated):
+        for name, tier, puzzle in bundled:
+            yield (f"{name}~{copy + 1}", tier, shuffle_puzzle(puzzle, rng))
+    for box in (4, 5):
+        tier = f"{box * box}x{box * box}"
+        for number in range(large):
+            yield (f"{tier}_{number + 1}", tier, large_puzzle(box, rng))
+
+
+def shuffle_puzzle(puzzle, rng):
+    # Applies a random relabeling, band/stack swap, row/column swap within bands and stacks, and
+    # transposition. The result is a different puzzle line with exactly the same difficulty.
+    def lines():
+        order = []
+        for band in rng.sample(range(3), 3):
+            order.extend(band * 3 + line for line in rng.sample(range(3), 3))
+        return order
+    labels = dict(zip('123456789', rng.sample('123456789', 9)))
+    rows, cols = lines(), lines()
+    transpose = rng.random() < 0.5
+    shuffled = []
+    for row in rows:
+        for col in cols:
+            char = puzzle[col * 9 + row] if transpose else puzzle[row * 9 + col]
+            shuffled.append(labels.get(char, char))
+    return ''.join(shuffled)
+
+
+# Fraction of cells blanked in generated puzzles. Unique 16x16 puzzles from sudoku_generator have about
+# two thirds of their cells blank. Half the cells is about as far as a 25x25 grid can be blanked before
+# some puzzles still need tens of seconds of search.
+LARGE_BLANKS = {4: 0.65, 5: 0.5}
+
+
+def large_puzzle(box, rng, blanks=None):
+    # A shuffled pattern grid with a fraction of its cells blanked. The givens come from a valid grid,
+    # so there is always a solution, though not always a unique one.
+    blanks = LARGE_BLANKS.get(box, 0.5) if blanks is None else blanks
+    board = board_for(box)
+    side = board.side
+
+    def lines():
+        order = []
+        for band in rng.sample(range(box), box):
+            order.extend(band * box + line for line in rng.sample(range(box), box))
+        return order
+    labels = rng.sample(board.symbols, side)
+    rows, cols = lines(), lines()
+    cells = [labels[(box * (row % box) + row // box + col) % side] for row in rows for col in cols]
+    for idx in rng.sample(range(board.cells), round(board.cells * blanks)):
+        cells[idx] = '_'
+    return ''.join(cells)
+
+
+def measure(puzzle, repeat=5, warmup=1):
+    for _ in range(warmup):
+        SudokuSolver.from_string(puzzle)
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        solver = SudokuSolver.from_string(puzzle)
+        times.append((perf_counter() - start) * 1000)
+    tracemalloc.start()
+    SudokuSolver.from_string(puzzle)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    strategies = SudokuSolver.from_string(puzzle, stats=True).strategy_stats()
+    return {
+        'median_ms': statistics.median(times),
+        'min_ms': min(times),
+        'mean_ms': statistics.fmean(times),
+        'loops': solver.loops,
+        'logic_cells': solver.placements,
+        'search_cells': solver.searched_cells,
+        'eliminations': solver.eliminations,
+        'unit_visits': solver.unit_visits,
+        'peak_kib': peak / 1024,
+        'solved': solver.puzzle_solved() and solver.valid_board,
+        'strategies': strategies,
+    }
+
+
+def run_benchmark(puzzles, repeat=5, warmup=1, report=None):
+    results = {}
+    for name, tier, puzzle in puzzles:
+        results[name] = dict(tier=tier, **measure(puzzle, repeat, warmup))
+        if report:
+            report(name, results[name])
+    tiers = {}
+    for name, result in results.items():
+        tiers.setdefault(result['tier'], []).append(result)
+    return {
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'warmup': warmup,
+        'puzzles': results,
+        'tiers': {tier: summarize(tier_results) for tier, tier_results in sorted(tiers.items())},
+    }
+
+
+def summarize(results):
+    return {
+        'count': len(results),
+        'median_ms': statistics.median(r['median_ms'] for r in results),
+        'total_ms': sum(r['median_ms'] for r in results),
+        'loops': statistics.fmean(r['loops'] for r in results),
+        'logic_cells': statistics.fmean(r['logic_cells'] for r in results),
+        'search_cells': statistics.fmean(r['search_cells'] for r in results),
+        'peak_kib': max(r['peak_kib'] for r in results),
+        'solved': sum(r['solved'] for r in results),
+        'strategy_ms': {name: sum(r['strategies'][name]['seconds'] for r in results) * 1000 for name in SudokuSolver.strategy_names},
+    }
+
+
+def compare(baseline, current, threshold=0.10, min_delta_ms=0.5):
+    # Returns one message per puzzle or tier whose median time grew by more than `threshold`
+    # (as a fraction of the baseline) and by more than `min_delta_ms`, or that no longer solves.
+    regressions = []
+    for section in ('tiers', 'puzzles'):
+        for name, old in baseline[section].items():
+            new = current[section].get(name)
+            if new is None:
+                continue
+            if new['median_ms'] > old['median_ms'] * (1 + threshold) and new['median_ms'] - old['median_ms'] > min_delta_ms:
+                regressions.append(f"{section[:-1]} {name}: {old['median_ms']:.2f}ms -> {new['median_ms']:.2f}ms")
+            if new['solved'] / new.get('count', 1) < old['solved'] / old.get('count', 1):
+                regressions.append(f"{section[:-1]} {name}: solved {old['solved']} -> {new['solved']}")
+    old, new = baseline.get('generator'), current.get('generator')
+    if old and new and old['workers'] == new['workers'] and new['puzzles_per_second'] < old['puzzles_per_second'] * (1 - threshold):
+        regressions.append(f"generator: {old['puzzles_per_second']:.1f} -> {new['puzzles_per_second']:.1f} puzzles/s")
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Time SudokuSolver over the bundled puzzles and optional corpora.")
+    parser.add_argument('--corpus', action='append', default=[], help="file with one puzzle per line")
+    parser.add_argument('--generated', type=int, default=0, help="shuffled copies of each bundled puzzle to add")
+    parser.add_argument('--large', type=int, default=0, help="random 16x16 and 25x25 puzzles of each size to add")
+    parser.add_argument('--generate', type=int, default=0, help="also time generating and rating this many puzzles")
+    parser.add_argument('--generate-workers', type=int, default=None, help="worker processes for --generate (default: one per CPU)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--output', type=str, help="write results as JSON to this file")
+    parser.add_argument('--compare', type=str, help="baseline JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help="ignore slowdowns smaller than this")
+    opts = parser.parse_args(args)
+
+    def report(name, result):
+        print(f"{name:<36} {result['median_ms']:8.2f}ms  loops {result['loops']:2}  logic {result['logic_cells']:2}  "
+              f"search {result['search_cells']:2}  peak {result['peak_kib']:7.1f}KiB")
+
+    current = run_benchmark(load_puzzles(opts.corpus, opts.generated, opts.seed, opts.large), opts.repeat, opts.warmup, report)
+    for tier, summary in current['tiers'].items():
+        print(f"[{tier}] {summary['count']} puzzles  median {summary['median_ms']:.2f}ms  total {summary['total_ms']:.2f}ms  "
+              f"solved {summary['solved']}/{summary['count']}")
+    if opts.generate:
+        generator = current['generator'] = generator_benchmark(opts.generate, opts.seed, opts.generate_workers)
+        print(f"[generator] {generator['count']} puzzles  {generator['seconds']:.2f}s  {generator['puzzles_per_second']:.1f} puzzles/s  "
+              f"workers {generator['workers']}  levels {generator['levels']}")
+    if opts.output:
+        with open(opts.output, 'w') as output:
+            json.dump(current, output, indent=2)
+    if opts.compare:
+        with open(opts.compare, 'r') as baseline_file:
+            regressions = compare(json.load(baseline_file), current, opts.threshold, opts.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import os
+import mmap
+import struct
+from operator import itemgetter
+from itertools import permutations, product
+from collections import OrderedDict
+from sudoku_solver import solve, all_values, blank_values
+
+STORE_MAGIC = b'SDKC'
+STORE_HEADER = struct.Struct('<4sHH')
+STORE_VERSION = 1
+RECORD_SIZE = 162
+# Puzzles whose pattern has this many equivalent transforms stop enumerating them here. Their key is
+# then still a valid transform of the puzzle, just not always the same one for every member of the class.
+MAX_TIED_TRANSFORMS = 200
+
+
+def normalize(puzzle):
+    if isinstance(puzzle, (bytes, bytearray, memoryview)):
+        puzzle = bytes(puzzle).decode('ascii')
+    puzzle = puzzle.strip()
+    if len(puzzle) != 81:
+        raise ValueError(f"puzzle must have 81 cells, got {len(puzzle)}")
+    for char in puzzle:
+        if char not in all_values and char not in blank_values:
+            raise ValueError(f"invalid cell value: {char}")
+    return ''.join('0' if char in blank_values else char for char in puzzle)
+
+
+def transpose(grid):
+    return ''.join(grid[col * 9 + row] for row in range(9) for col in range(9))
+
+
+def column_orders(line):
+    # Every column order that puts this line's givens as far left as possible: stacks by given count,
+    # most first, and givens before blanks inside each stack.
+    stacks = []
+    for stack in range(3):
+        cols = range(stack * 3, stack * 3 + 3)
+        givens = [col for col in cols if line[col] != '0']
+        blanks = [col for col in cols if line[col] == '0']
+        stacks.append((len(givens), [g + b for g in permutations(givens) for b in permutations(blanks)]))
+    for stack_order in permutations(range(3)):
+        if all(stacks[a][0] >= stacks[b][0] for a, b in zip(stack_order, stack_order[1:])):
+            for orders in product(*(stacks[stack][1] for stack in stack_order)):
+                yield orders[0] + orders[1] + orders[2]
+
+
+def best_row_orders(patterns, first):
+    # Row orders that make the pattern rows lexicographically largest, given the first row. The first
+    # row's band comes first; the other two bands follow, largest first, with each band's rows largest first.
+    def band_orders(rows, fixed=()):
+        rows = sorted(rows, key=patterns.__getitem__, reverse=True)
+        best = [patterns[row] for row in rows]
+        if len(set(best)) == len(best):
+            return [fixed + tuple(rows)]
+        return [fixed + order for order in permutations(rows) if [patterns[row] for row in order] == best]
+
+    band = first // 3
+    heads = band_orders([row for row in range(band * 3, band * 3 + 3) if row != first], (first,))
+    others = [band_orders(range(b * 3, b * 3 + 3)) for b in range(3) if b != band]
+    second, third = (tuple(patterns[row] for row in orders[0]) for orders in others)
+    tails = [others[::-1]] if second < third else [others, others[::-1]] if second == third else [others]
+    for head in heads:
+        for second_orders, third_orders in tails:
+            for second in second_orders:
+                for third in third_orders:
+                    yield head + second + third
+
+
+def line_score(pattern):
+    # The largest pattern a single line can be moved to: givens leftmost in each stack, fullest stacks first.
+    counts = sorted((pattern[stack * 3:stack * 3 + 3].count('1') for stack in range(3)), reverse=True)
+    return tuple(''.join('1' * count + '0' * (3 - count) for count in counts))
+
+
+def tied_transforms(puzzle):
+    # The (transposed, rows, cols) transforms that reach the largest pattern. Once MAX_TIED_TRANSFORMS
+    # of them are tied, the search stops there, so highly symmetric patterns, such as an empty or a full
+    # grid, cost no more than a bounded number of transforms.
+    best_pattern = None
+    tied = []
+    for transposed in (False, True):
+        grid = transpose(puzzle) if transposed else puzzle
+        lines = [grid[row * 9:row * 9 + 9] for row in range(9)]
+        patterns = [''.join('0' if char == '0' else '1' for char in line) for line in lines]
+        line_scores = [line_score(pattern) for pattern in patterns]
+        top = max(line_scores)
+        if best_pattern is not None and top < best_pattern[0]:
+            continue
+        for first in range(9):
+            if line_scores[first] != top:
+                continue
+            for cols in column_orders(patterns[first]):
+                getter = itemgetter(*cols)
+                moved = [getter(pattern) for pattern in patterns]
+                band = first // 3 * 3
+                head = (moved[first],) + tuple(sorted((moved[row] for row in range(band, band + 3) if row != first), reverse=True))
+                if best_pattern is not None and head < best_pattern[:3]:
+                    continue
+                for rows in best_row_orders(moved, first):
+                    candidate = tuple(moved[row] for row in rows)
+                    if best_pattern is None or candidate > best_pattern:
+                        best_pattern = candidate
+                        tied = []
+                    if candidate == best_pattern:
+                        tied.append((transposed, rows, cols))
+                        if len(tied) == MAX_TIED_TRANSFORMS:
+                            return tied
+    return tied
+
+
+def canonical_form(puzzle):
+    # Maps a normalized puzzle to (canonical puzzle, transform). The canonical puzzle is the given/blank
+    # pattern pushed to its lexicographic maximum by transposition, band, stack, row and column swaps,
+    # then, among the transforms that reach it, the smallest grid after relabeling digits in order of
+    # first appearance. Equivalent puzzles share the canonical puzzle, so they share a cache entry.
+    tied = tied_transforms(puzzle)
+    grids = (puzzle, transpose(puzzle))
+    best = None
+    for transposed, rows, cols in tied:
+        moved = ''.join(itemgetter(*(row * 9 + col for row in rows for col in cols))(grids[transposed]))
+        # Digits missing from the givens still get a label, after the others, so the solution can be mapped back.
+        order = ''.join(dict.fromkeys(moved.replace('0', '') + '123456789'))
+        labels = {'0': '0', **{char: str(label) for label, char in enumerate(order, 1)}}
+        relabeled = moved.translate(str.maketrans(labels))
+        if best is None or relabeled < best[0]:
+            best = (relabeled, (transposed, rows, cols, labels))
+    return best
+
+
+def apply_transform(grid, transform):
+    transposed, rows, cols, labels = transform
+    grid = transpose(grid) if transposed else grid
+    return ''.join(labels.get(grid[row * 9 + col], grid[row * 9 + col]) for row in rows for col in cols)
+
+
+def invert_transform(grid, transform):
+    # Maps a grid in canonical coordinates, such as the canonical puzzle's solution, back to the original puzzle's.
+    transposed, rows, cols, labels = transform
+    unlabels = {canonical: original for original, canonical in labels.items()}
+    cells = [None] * 81
+    for position, char in enumerate(grid):
+        cells[rows[position // 9] * 9 + cols[position % 9]] = unlabels.get(char, char)
+    restored = ''.join(cells)
+    return transpose(restored) if transposed else restored
+
+
+class SolutionCache:
+    # An LRU map from canonical puzzles to their solutions, in front of solve(). Only solved puzzles are
+    # cached. With a path, every new solution is also appended to an on-disk store of fixed-size records,
+    # read back through mmap, so a new cache on the same file starts warm. The store never grows past
+    # max_disk_entries; entries evicted from memory are still found there.
+
+    def __init__(self, max_entries=100000, path=None, max_disk_entries=10000000, search=True):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.search = search
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.path = path
+        self.disk_index = {}
+        self.disk_map = None
+        self.disk_file = None
+        if path:
+            self.open_store(path)
+
+    def open_store(self, path):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, 'wb') as store:
+                store.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, RECORD_SIZE))
+        self.disk_file = open(path, 'r+b')
+        magic, version, record_size = STORE_HEADER.unpack(self.disk_file.read(STORE_HEADER.size))
+        if magic != STORE_MAGIC or version != STORE_VERSION or record_size != RECORD_SIZE:
+            self.disk_file.close()
+            raise ValueError(f"not a solution store: {path}")
+        self.remap()
+        # A record cut short by a crash mid-append is ignored and overwritten by the next append.
+        records = (len(self.disk_map) - STORE_HEADER.size) // RECORD_SIZE
+        for record in range(records):
+            offset = STORE_HEADER.size + record * RECORD_SIZE
+            self.disk_index[self.disk_map[offset:offset + 81].decode('ascii')] = offset + 81
+        self.disk_end = STORE_HEADER.size + records * RECORD_SIZE
+
+    def remap(self):
+        if self.disk_map is not None:
+            self.disk_map.close()
+        self.disk_file.seek(0, os.SEEK_END)
+        self.disk_map = mmap.mmap(self.disk_file.fileno(), self.disk_file.tell(), access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self.disk_file:
+            self.disk_map.close()
+            self.disk_file.close()
+            self.disk_file = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return {'entries': len(self.entries), 'disk_entries': len(self.disk_index), 'hits': self.hits,
+                'disk_hits': self.disk_hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def lookup(self, key):
+        solution = self.entries.get(key)
+        if solution is not None:
+            self.entries.move_to_end(key)
+            return solution
+        offset = self.disk_index.get(key)
+        if offset is not None:
+            if offset + 81 > len(self.disk_map):
+                self.remap()
+            solution = self.disk_map[offset:offset + 81].decode('ascii')
+            self.disk_hits += 1
+            self.remember(key, solution)
+        return solution
+
+    def remember(self, key, solution):
+        self.entries[key] = solution
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def store(self, key, solution):
+        self.remember(key, solution)
+        if self.disk_file and key not in self.disk_index and len(self.disk_index) < self.max_disk_entries:
+            self.disk_file.seek(self.disk_end)
+            self.disk_file.write(key.encode('ascii') + solution.encode('ascii'))
+            self.disk_file.flush()
+            self.disk_index[key] = self.disk_end + 81
+            self.disk_end += RECORD_SIZE
+
+    def solve(self, puzzle, time_budget=None):
+        # Returns the solution line, as solve(puzzle).solution would, answering from the cache when an
+        # equivalent puzzle has been solved before. time_budget is in seconds, as for solve().
+        try:
+            normalized = normalize(puzzle)
+        except ValueError:
+            # Only 9x9 lines are canonicalized. Other board sizes go straight to solve(), which also
+            # reports malformed puzzles.
+            return solve(puzzle, search=self.search, time_budget=time_budget).solution
+        key, transform = canonical_form(normalized)
+        solution = self.lookup(key)
+        if solution is not None:
+            self.hits += 1
+            return invert_transform(solution, transform)
+        self.misses += 1
+        result = solve(key, search=self.search, time_budget=time_budget)
+        if result.solved:
+            self.store(key, result.solution)
+            return invert_transform(result.solution, transform)
+        if result.out_of_budget:
+            # Solving the original too would spend a second budget.
+            return invert_transform(result.solution, transform)
+        return solve(puzzle, search=self.search).solution
@@ -0,0 +1,231 @@
+import os
+import sys
+import math
+import mmap
+import struct
+import argparse
+from multiprocessing import Pool
+from sudoku_batch import read_puzzles, solve_line
+from sudoku_solver import SYMBOLS
+
+# A packed corpus is a header followed by fixed-size records, one per puzzle, so record i starts at
+# HEADER.size + i * record_size and no separate offset index is needed. Each cell is stored in
+# bits_per_cell bits, most significant first, as 0 for a blank or the cell's value.
+MAGIC = b'SDKP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHBBHQ12x')
+PUZZLES, RESULTS = 0, 1
+BLANKS = '_.0'
+# Cells of boards up to 15x15 fit in four bits, which are packed and unpacked as hex digits.
+TO_HEX = str.maketrans({**{char: '0' for char in BLANKS}, **{char: f"{value:x}" for value, char in enumerate(SYMBOLS[:15], 1)}})
+FROM_HEX = str.maketrans({'0': '_', **{f"{value:x}": char for value, char in enumerate(SYMBOLS[:15], 1)}})
+
+
+def record_layout(side):
+    bits = side.bit_length()
+    return bits, (side * side * bits + 7) // 8
+
+
+def encode(puzzle, side=9):
+    if isinstance(puzzle, (bytes, bytearray, memoryview)):
+        puzzle = bytes(puzzle).decode('ascii')
+    puzzle = puzzle.strip()
+    cells = side * side
+    if len(puzzle) != cells:
+        raise ValueError(f"puzzle must have {cells} cells, got {len(puzzle)}")
+    bits, size = record_layout(side)
+    invalid = set(puzzle) - set(SYMBOLS[:side]) - set(BLANKS)
+    if invalid:
+        raise ValueError(f"invalid cell value: {next(char for char in puzzle if char in invalid)}")
+    if bits == 4:
+        return bytes.fromhex(puzzle.translate(TO_HEX) + '0' * (cells % 2))
+    values = [0 if char in BLANKS else SYMBOLS.index(char) + 1 for char in puzzle]
+    number = 0
+    for value in values:
+        number = number << bits | value
+    return (number << (size * 8 - cells * bits)).to_bytes(size, 'big')
+
+
+def decode(record, side=9):
+    cells = side * side
+    bits, size = record_layout(side)
+    if bits == 4:
+        return bytes(record).hex()[:cells].translate(FROM_HEX)
+    number = int.from_bytes(record, 'big') >> (size * 8 - cells * bits)
+    mask = (1 << bits) - 1
+    values = [number >> (bits * (cells - 1 - idx)) & mask for idx in range(cells)]
+    return ''.join(SYMBOLS[value - 1] if value else '_' for value in values)
+
+
+def create(path, count, side=9, kind=PUZZLES):
+    # Makes a corpus of `count` blank records, to be filled in place, e.g. by several workers at once.
+    bits, size = record_layout(side)
+    with open(path, 'wb') as packed:
+        packed.write(HEADER.pack(MAGIC, VERSION, side, bits, kind, size, count))
+        packed.truncate(HEADER.size + count * size)
+
+
+class PackedWriter:
+    # Appends records one at a time, for inputs too large or too streamed to count first. The record
+    # count in the header is filled in by close().
+
+    def __init__(self, path, side=9, kind=PUZZLES):
+        self.side = side
+        self.kind = kind
+        self.bits, self.record_size = record_layout(side)
+        self.count = 0
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, side, self.bits, kind, self.record_size, 0))
+
+    def append(self, puzzle):
+        self.file.write(encode(puzzle, self.side))
+        self.count += 1
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.side, self.bits, self.kind, self.record_size, self.count))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PackedCorpus:
+    # Memory-maps a packed corpus. Indexing decodes one record; raw() returns it as a memoryview into
+    # the map. Slicing and shard() return views of a range of records over the same map, so workers
+    # can each take a disjoint part without reading the rest; closing any of them closes the shared map.
+    # Opened writable, records can be assigned.
+
+    def __init__(self, path, writable=False):
+        self.file = open(path, 'r+b' if writable else 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, version, self.side, self.bits, self.kind, self.record_size, count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"not a packed corpus: {path}")
+        if len(self.map) < HEADER.size + count * self.record_size:
+            self.close()
+            raise ValueError(f"packed corpus is truncated: {path}")
+        self.view = memoryview(self.map)
+        self.start, self.stop = 0, count
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def offset(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return HEADER.size + (self.start + index) * self.record_size
+
+    def raw(self, index):
+        offset = self.offset(index)
+        return self.view[offset:offset + self.record_size]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("packed corpus slices must be contiguous")
+            part = object.__new__(type(self))
+            part.__dict__.update(self.__dict__)
+            part.start, part.stop = self.start + start, self.start + max(start, stop)
+            return part
+        return decode(self.raw(index), self.side)
+
+    def __setitem__(self, index, puzzle):
+        offset = self.offset(index)
+        self.view[offset:offset + self.record_size] = encode(puzzle, self.side)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def shard(self, shard, shards):
+        # The shard-th of `shards` near-equal contiguous parts.
+        return self[len(self) * shard // shards:len(self) * (shard + 1) // shards]
+
+    def close(self):
+        if hasattr(self, 'view'):
+            self.view.release()
+        self.map.close()
+        self.file.close()
+
+
+def pack_text(text_path, packed_path, side=None):
+    # Without a side, the board size is taken from the length of the first puzzle.
+    with open(text_path, 'r') as text:
+        puzzles = read_puzzles(text)
+        first = next(puzzles, None)
+        if side is None:
+            side = math.isqrt(len(first)) if first else 9
+        with PackedWriter(packed_path, side) as writer:
+            if first:
+                writer.append(first)
+            for puzzle in puzzles:
+                writer.append(puzzle)
+    return writer.count
+
+
+def unpack_text(packed_path, text_path):
+    corpus = PackedCorpus(packed_path)
+    try:
+        with open(text_path, 'w') as text:
+            for puzzle in corpus:
+                text.write(puzzle + '\n')
+    finally:
+        corpus.close()
+
+
+def solve_shard(item):
+    # Solves one shard of a packed corpus into the matching records of a results file. Malformed
+    # puzzles can't be in a packed corpus; puzzles with no solution are written as they were left.
+    corpus_path, results_path, shard, shards = item
+    corpus = PackedCorpus(corpus_path).shard(shard, shards)
+    results = PackedCorpus(results_path, writable=True).shard(shard, shards)
+    try:
+        for index, puzzle in enumerate(corpus):
+            results[index] = solve_line(puzzle)
+    finally:
+        corpus.close()
+        results.close()
+    return len(corpus)
+
+
+def solve_packed(corpus_path, results_path, workers=None, shards=None):
+    corpus = PackedCorpus(corpus_path)
+    count, side = len(corpus), corpus.side
+    corpus.close()
+    create(results_path, count, side, RESULTS)
+    workers = workers or os.cpu_count() or 1
+    items = [(corpus_path, results_path, shard, shards or workers) for shard in range(shards or workers)]
+    if workers == 1:
+        return sum(map(solve_shard, items))
+    with Pool(workers) as pool:
+        return sum(pool.imap_unordered(solve_shard, items))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Convert puzzle files to and from the packed corpus format, or solve a packed corpus.")
+    parser.add_argument('mode', choices=('pack', 'unpack', 'solve'))
+    parser.add_argument('input', type=str)
+    parser.add_argument('output', type=str)
+    parser.add_argument('--workers', type=int, default=None, help="solve mode: worker processes (default: one per CPU)")
+    parser.add_argument('--side', type=int, default=None, choices=(4, 9, 16, 25), help="pack mode: cells per row (default: from the first puzzle's length)")
+    parser.add_argument('--shards', type=int, default=None, help="solve mode: parts to split the corpus into (default: one per worker)")
+    opts = parser.parse_args(args)
+
+    if opts.mode == 'pack':
+        print(f"packed {pack_text(opts.input, opts.output, opts.side)} puzzles", file=sys.stderr)
+    elif opts.mode == 'unpack':
+        unpack_text(opts.input, opts.output)
+    else:
+        print(f"solved {solve_packed(opts.input, opts.output, opts.workers, opts.shards)} puzzles", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import os
+import sys
+import random
+import argparse
+import threading
+from time import perf_counter
+from collections import Counter, namedtuple
+from multiprocessing import Pool
+from sudoku_solver import SudokuSolver, search_solutions, board_for
+
+Rating = namedtuple('Rating', 'level name strategies')
+# Difficulty levels by the hardest strategy a puzzle needs. fish_sweep is the scheduled strategy that
+# runs fish, and search only runs once every strategy is stuck.
+LEVELS = ('easy', 'medium', 'hard', 'expert', 'fiendish')
+STRATEGY_LEVELS = {'impossible_in_entity': 0,
+                   'solve_for_values_with_only_one_cell_left': 0,
+                   'solve_for_cells_with_only_one_value_left': 0,
+                   'check_vector_beyond_blk': 1,
+                   'check_subvectors_within_blk': 1,
+                   'shared_naked_values': 2,
+                   'shared_hidden_values': 2,
+                   'fish': 3,
+                   'fish_sweep': 3,
+                   'search_remaining_cells': 4}
+
+
+def random_grid(rng, board=None):
+    # Fills the blocks on the diagonal, which share no units, with random permutations and lets the search
+    # complete the grid. The result is relabeled at random, since the search always tries the lowest value first.
+    board = board or board_for(3)
+    cands = [board.all_candidates] * board.cells
+    for diagonal in range(board.box):
+        blk = board.units[2 * board.side + diagonal * (board.box + 1)]
+        for idx, value in zip(blk, rng.sample(range(board.side), board.side)):
+            cands[idx] = 1 << value
+    grid = [mask.bit_length() for mask in search_solutions(cands, 1, board)[0]]
+    labels = [0] + rng.sample(range(1, board.side + 1), board.side)
+    return [labels[value] for value in grid]
+
+
+def remove_clues(grid, rng, board=None, symmetric=False):
+    # Blanks cells in random order, keeping each removal only if the puzzle still has one solution.
+    # With symmetric, cells are blanked in pairs opposite each other through the centre.
+    board = board or board_for(3)
+    givens = list(grid)
+    cells = list(range(board.cells))
+    rng.shuffle(cells)
+    for idx in cells:
+        group = {idx, board.cells - 1 - idx} if symmetric else {idx}
+        if all(givens[cell] for cell in group) and stays_unique(givens, group, grid, board):
+            for cell in group:
+                givens[cell] = 0
+    return givens
+
+
+def stays_unique(givens, blanked, grid, board):
+    # The check is incremental: with the other givens fixed, the puzzle stays unique exactly when no
+    # solution has a different value in a newly blanked cell. That is one search for a single solution
+    # with the grid's value excluded, rather than a count of two over the whole puzzle.
+    for cell in blanked:
+        bit = 1 << (grid[cell] - 1)
+        seen = 0
+        for peer in board.peers[cell]:
+            if givens[peer] and peer not in blanked:
+                seen |= 1 << (givens[peer] - 1)
+        if seen | bit == board.all_candidates:
+            # The cell's peers still hold every other value, so it's a naked single and needs no search.
+            continue
+        cands = [1 << (value - 1) if value else board.all_candidates for value in givens]
+        for other in blanked:
+            cands[other] = board.all_candidates
+        cands[cell] &= ~bit
+        if search_solutions(cands, 1, board):
+            return False
+    return True
+
+
+def rate(puzzle):
+    # Rates the puzzle by the lowest level whose strategies solve it without search, trying one level more
+    # each time. Which strategy first makes progress in a solve with all of them isn't enough: block/line
+    # and subset strategies share a scheduler tier, and rows and columns are visited before blocks.
+    for level in range(len(LEVELS)):
+        solver = SudokuSolver.from_string(puzzle, solve=False, search=level == len(LEVELS) - 1, stats=True)
+        solver.strategies = tuple(strategy for strategy in SudokuSolver.strategies if STRATEGY_LEVELS.get(strategy.name, 0) <= level)
+        solver.solve_puzzle()
+        if solver.result().solved:
+            break
+    used = [name for name, stats in solver.strategy_stats().items() if stats['eliminations'] or stats['placements']]
+    return Rating(level, LEVELS[level], tuple(used))
+
+
+def generate_one(seed, box=3, symmetric=False):
+    # Returns (puzzle line, Rating) for one seed, so the same seed always gives the same puzzle.
+    rng = random.Random(seed)
+    board = board_for(box)
+    puzzle = board.line(remove_clues(random_grid(rng, board), rng, board, symmetric))
+    return puzzle, rate(puzzle)
+
+
+def _generate_seed(item):
+    seed, box, symmetric = item
+    return generate_one(seed, box, symmetric)
+
+
+def generate(count, seed=0, workers=None, box=3, symmetric=False, levels=None, chunksize=4):
+    # Yields (puzzle, Rating) pairs until count puzzles have been yielded. Seeds are consecutive from seed
+    # and results come back in seed order, so a run is repeatable whatever the number of workers. With
+    # levels, puzzles rated outside them are discarded and more seeds are tried.
+    if count <= 0:
+        return
+    workers = workers or os.cpu_count() or 1
+    # The seeds never run out, so the pool's feeder thread is held to a bounded number of seeds in flight.
+    in_flight = threading.Semaphore(chunksize * (workers + 1) * 2)
+    stopped = threading.Event()
+
+    def seeds():
+        next_seed = seed
+        while True:
+            in_flight.acquire()
+            if stopped.is_set():
+                return
+            yield (next_seed, box, symmetric)
+            next_seed += 1
+    produced = 0
+    pool = Pool(workers) if workers > 1 else None
+    results = pool.imap(_generate_seed, seeds(), chunksize) if pool else map(_generate_seed, seeds())
+    try:
+        for puzzle, rating in results:
+            in_flight.release()
+            if levels and rating.name not in levels:
+                continue
+            yield puzzle, rating
+            produced += 1
+            if produced == count:
+                return
+    finally:
+        stopped.set()
+        in_flight.release()
+        if pool:
+            pool.terminate()
+
+
+def benchmark(count=50, seed=0, workers=None, box=3, symmetric=False):
+    start = perf_counter()
+    levels = Counter(rating.name for _, rating in generate(count, seed, workers, box, symmetric))
+    seconds = perf_counter() - start
+    return {'count': count, 'workers': workers or os.cpu_count() or 1, 'seconds': seconds,
+            'puzzles_per_second': count / seconds if seconds else 0.0, 'levels': dict(levels)}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Generate puzzles with a unique solution, rated by the strategies they need.")
+    parser.add_argument('count', type=int)
+    parser.add_argument('--output', type=str, default='-', help="puzzle file, or - for stdout")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--box', type=int, default=3, choices=(2, 3, 4), help="block size: 3 for 9x9, 4 for 16x16")
+    parser.add_argument('--symmetric', action='store_true', help="remove clues in pairs, keeping 180 degree symmetry")
+    parser.add_argument('--level', action='append', choices=LEVELS, help="keep only puzzles of this rating (repeatable)")
+    parser.add_argument('--rated', action='store_true', help="follow each puzzle with a space and its rating")
+    opts = parser.parse_args(args)
+
+    out_stream = sys.stdout if opts.output == '-' else open(opts.output, 'w')
+    levels = Counter()
+    start = perf_counter()
+    try:
+        for puzzle, rating in generate(opts.count, opts.seed, opts.workers, opts.box, opts.symmetric, opts.level):
+            out_stream.write(f"{puzzle} {rating.name}\n" if opts.rated else f"{puzzle}\n")
+            levels[rating.name] += 1
+    finally:
+        if out_stream is not sys.stdout:
+            out_stream.close()
+    seconds = perf_counter() - start
+    counts = '  '.join(f"{level} {levels[level]}" for level in LEVELS if levels[level])
+    print(f"generated {opts.count} puzzles in {seconds:.2f}s ({opts.count / seconds:.1f} puzzles/s)  {counts}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from sudoku_batch import solve_line
+from sudoku_cache import SolutionCache
+
+WARMUP_PUZZLE = '8__________36______7__9_2___5___7_______457_____1___3___1____68__85___1__9____4__'
+
+
+_cache = None
+
+
+def warm_worker(cache_size=0):
+    # Runs once in each worker process so the first real batch doesn't pay for imports and table setup.
+    global _cache
+    if cache_size:
+        _cache = SolutionCache(cache_size)
+    solve_line(WARMUP_PUZZLE)
+
+
+def solve_cached(line, time_budget=None):
+    try:
+        return _cache.solve(line, time_budget)
+    except ValueError as exc:
+        return f"error: {exc}"
+
+
+def solve_batch(requests):
+    # Each request is (puzzle, seconds left before its deadline when the batch was sent). A solve stops at
+    # its deadline, so an expired request doesn't hold the worker after the client has had its reply.
+    start = time.monotonic()
+    replies = []
+    for puzzle, seconds in requests:
+        deadline = start + seconds
+        reply = (solve_cached if _cache else solve_line)(puzzle, max(deadline - time.monotonic(), 0))
+        replies.append("error: deadline exceeded" if time.monotonic() > deadline else reply)
+    return replies
+
+
+class LatencyHistogram:
+    # Log-spaced buckets, four per doubling, counted in microseconds. Percentiles report the
+    # upper edge of the bucket they fall in, so they are accurate to about 19%.
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        bucket = max(0, math.ceil(math.log2(max(seconds * 1e6, 1)) * 4))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** (bucket / 4) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p90_ms': self.percentile(90) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class SolverService:
+    # Line protocol: each request line is a puzzle, one character per cell, optionally followed by a space and
+    # a deadline in milliseconds. Each reply line is the solution or "error: ...", in request order
+    # per connection. The line STATS replies with a JSON object of counters and latencies.
+    # Requests are collected into batches of up to batch_size, or whatever arrived within batch_wait_ms,
+    # and each batch is solved in one call on a worker process. At most max_pending requests are
+    # queued; beyond that connections stop being read, which pushes back on clients through TCP.
+    # With cache_size, each worker keeps a SolutionCache of that many entries.
+
+    def __init__(self, workers=None, batch_size=32, batch_wait_ms=2.0, max_pending=4096, deadline_ms=1000.0, cache_size=0):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_pending = max_pending
+        self.deadline = deadline_ms / 1000
+        self.latency = LatencyHistogram()
+        self.counters = {'requests': 0, 'solved': 0, 'errors': 0, 'expired': 0, 'batches': 0}
+        self.pool = None
+        self.queue = None
+        self.server = None
+        self.batcher = None
+        self.connections = {}
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        self.pool = ProcessPoolExecutor(self.workers, initializer=warm_worker, initargs=(self.cache_size,))
+        # Submitting one warmup per worker forces every process to start before the first request.
+        await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(self.pool, solve_batch, []) for _ in range(self.workers)))
+        self.queue = asyncio.Queue(self.max_pending)
+        self.in_flight = asyncio.Semaphore(self.workers * 2)
+        self.batcher = asyncio.create_task(self.collect_batches())
+        if path:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        # Closing the transports ends each connection's read loop; its queued replies are dropped.
+        for writer in self.connections.values():
+            writer.transport.abort()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        self.batcher.cancel()
+        self.pool.shutdown()
+
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    def stats(self):
+        return dict(self.counters, latency=self.latency.summary(), queued=self.queue.qsize(),
+                    batch_size_mean=self.counters['requests'] / max(self.counters['batches'], 1))
+
+    async def handle_connection(self, reader, writer):
+        self.connections[asyncio.current_task()] = writer
+        replies = asyncio.Queue()
+        replier = asyncio.create_task(self.write_replies(replies, writer))
+        try:
+            while line := await reader.readline():
+                fields = line.decode().split()
+                if not fields:
+                    continue
+                if fields[0] == 'STATS':
+                    await replies.put(json.dumps(self.stats()))
+                    continue
+                start = time.monotonic()
+                try:
+                    deadline = start + (float(fields[1]) / 1000 if len(fields) > 1 else self.deadline)
+                except ValueError:
+                    await replies.put(f"error: invalid deadline: {fields[1]}")
+                    continue
+                future = asyncio.get_running_loop().create_future()
+                await self.queue.put((fields[0], deadline, future))
+                await replies.put((future, start, deadline))
+            await replies.put(None)
+            await replier
+        finally:
+            replier.cancel()
+            writer.close()
+            del self.connections[asyncio.current_task()]
+
+    async def write_replies(self, replies, writer):
+        while (reply := await replies.get()) is not None:
+            if isinstance(reply, tuple):
+                future, start, deadline = reply
+                try:
+                    reply = await asyncio.wait_for(asyncio.shield(future), max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    reply = "error: deadline exceeded"
+                    self.counters['expired'] += 1
+                self.latency.record(time.monotonic() - start)
+                self.counters['requests'] += 1
+                self.counters['errors' if reply.startswith('error') else 'solved'] += 1
+            writer.write(reply.encode() + b"\n")
+            if replies.empty():
+                await writer.drain()
+
+    async def collect_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            batch_end = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), batch_end - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            now = time.monotonic()
+            # Requests whose deadline passed while queued are answered by write_replies; skip solving them.
+            batch = [request for request in batch if request[1] > now]
+            if batch:
+                await self.in_flight.acquire()
+                self.counters['batches'] += 1
+                asyncio.create_task(self.run_batch(batch))
+
+    async def run_batch(self, batch):
+        try:
+            now = time.monotonic()
+            requests = [(puzzle, deadline - now) for puzzle, deadline, _ in batch]
+            results = await asyncio.get_running_loop().run_in_executor(self.pool, solve_batch, requests)
+        except Exception as exc:
+            results = [f"error: {exc}"] * len(batch)
+        finally:
+            self.in_flight.release()
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def open_client(host='127.0.0.1', port=8765, path=None):
+    if path:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def solve_remote(puzzles, host='127.0.0.1', port=8765, path=None, deadline_ms=None):
+    # Pipelines every puzzle over one connection and returns the replies in order.
+    reader, writer = await open_client(host, port, path)
+    suffix = f" {deadline_ms}" if deadline_ms else ""
+    writer.write(''.join(f"{puzzle}{suffix}\n" for puzzle in puzzles).encode())
+    await writer.drain()
+    replies = [(await reader.readline()).decode().rstrip("\n") for _ in puzzles]
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+
+async def service_stats(host='127.0.0.1', port=8765, path=None):
+    reader, writer = await open_client(host, port, path)
+    writer.write(b"STATS\n")
+    stats = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return stats
+
+
+async def generate_load(puzzles, requests=1000, connections=8, window=16, host='127.0.0.1', port=8765, path=None, deadline_ms=None):
+    # Sends `requests` puzzles, drawn in turn from `puzzles`, over `connections` connections with up to
+    # `window` unanswered requests each. Returns throughput and client-side latency percentiles.
+    latency = LatencyHistogram()
+    errors = 0
+    suffix = f" {deadline_ms}" if deadline_ms else ""
+    shares = [requests // connections + (n < requests % connections) for n in range(connections)]
+
+    async def connection(count, offset):
+        nonlocal errors
+        reader, writer = await open_client(host, port, path)
+        sent_at = []
+        window_open = asyncio.Semaphore(window)
+
+        async def send():
+            for n in range(count):
+                await window_open.acquire()
+                sent_at.append(time.monotonic())
+                writer.write(f"{puzzles[(offset + n) % len(puzzles)]}{suffix}\n".encode())
+                await writer.drain()
+
+        sender = asyncio.create_task(send())
+        for n in range(count):
+            reply = await reader.readline()
+            latency.record(time.monotonic() - sent_at[n])
+            window_open.release()
+            errors += reply.startswith(b"error")
+        await sender
+        writer.close()
+
+    start = time.monotonic()
+    await asyncio.gather(*(connection(count, sum(shares[:n])) for n, count in enumerate(shares)))
+    elapsed = time.monotonic() - start
+    return dict(latency.summary(), requests=requests, errors=errors, seconds=elapsed, per_second=requests / elapsed if elapsed else 0.0)
+
+
+def read_corpus(paths):
+    from sudoku_bench import load_puzzles
+    return [puzzle for _, _, puzzle in load_puzzles(paths)]
+
+
+async def serve(opts):
+    service = SolverService(opts.workers, opts.batch_size, opts.batch_wait_ms, opts.max_pending, opts.deadline_ms, opts.cache_size)
+    server = await service.start(opts.host, opts.port, opts.unix)
+    print(f"serving on {opts.unix or service.address()}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Serve SudokuSolver over a line protocol, or load test a running service.")
+    parser.add_argument('mode', choices=('serve', 'load', 'stats'))
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', type=str, help="Unix socket path, used instead of host and port")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--batch-size', type=int, default=32, help="most puzzles solved per worker call")
+    parser.add_argument('--batch-wait-ms', type=float, default=2.0, help="how long to wait to fill a batch")
+    parser.add_argument('--max-pending', type=int, default=4096, help="queued requests before reads are paused")
+    parser.add_argument('--deadline-ms', type=float, default=1000.0, help="default per-request deadline")
+    parser.add_argument('--cache-size', type=int, default=0, help="solutions each worker caches by puzzle symmetry class")
+    parser.add_argument('--corpus', action='append', default=[], help="load mode: puzzle files to draw from, besides puzzles/")
+    parser.add_argument('--requests', type=int, default=1000, help="load mode: puzzles to send")
+    parser.add_argument('--connections', type=int, default=8, help="load mode: concurrent connections")
+    parser.add_argument('--window', type=int, default=16, help="load mode: unanswered requests per connection")
+    parser.add_argument('--seed', type=int, default=0)
+    opts = parser.parse_args(args)
+
+    if opts.mode == 'serve':
+        try:
+            asyncio.run(serve(opts))
+        except KeyboardInterrupt:
+            pass
+    elif opts.mode == 'stats':
+        print(json.dumps(asyncio.run(service_stats(opts.host, opts.port, opts.unix)), indent=2))
+    else:
+        puzzles = read_corpus(opts.corpus)
+        random.Random(opts.seed).shuffle(puzzles)
+        report = asyncio.run(generate_load(puzzles, opts.requests, opts.connections, opts.window, opts.host, opts.port, opts.unix))
+        print(f"{report['requests']} requests in {report['seconds']:.2f}s  {report['per_second']:.0f}/s  "
+              f"p50 {report['p50_ms']:.2f}ms  p99 {report['p99_ms']:.2f}ms  max {report['max_ms']:.2f}ms  errors {report['errors']}")
+
+
+if __name__ == '__main__':
+    main()
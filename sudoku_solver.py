@@ -1,105 +1,828 @@
 import sys
-import math
-import argparse
+import random
+import json
+import struct
 from enum import Enum
-from big_board import big_board
-from itertools import chain, combinations
-from collections import defaultdict
+from time import perf_counter
+from collections import namedtuple
 
 Entity = Enum('Entity', 'row col blk')
+SolveResult = namedtuple('SolveResult', 'puzzle solution solved valid loops eliminations placements searched_cells unit_visits stats trace out_of_budget')
+Strategy = namedtuple('Strategy', 'name tier cost scope')
 all_values = set([str(i) for i in range(1, 10)])
+blank_values = set('_.0')
+# Cell values above 9 are written as letters, so a 25x25 board uses 1-9 and A-P.
+SYMBOLS = '123456789ABCDEFGHIJKLMNOP'
+ALL_CANDIDATES = 0x1FF
+POPCOUNT = tuple(bin(mask).count('1') for mask in range(ALL_CANDIDATES + 1))
+
+
+def lowest_bit(mask):
+    return mask & -mask
+
+
+def luby(i):
+    # The i-th term, counting from 1, of 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...
+    size = 1
+    while size < i:
+        size = 2 * size + 1
+    while i != size:
+        size //= 2
+        if i > size:
+            i -= size
+    return (size + 1) // 2
+
+
+class BitCount:
+    # Stands in for a POPCOUNT table on boards too wide to tabulate every candidate mask.
+    __getitem__ = staticmethod(int.bit_count)
+
+
+class Board:
+    # Topology of a board of box x box blocks, with side = box * box values, built once per size.
+    # Cells are indexed row by row and units as rows, columns, then blocks. The standard board's
+    # tables are also the module constants ROWS, COLS, UNITS and so on.
+
+    def __init__(self, box=3):
+        side = box * box
+        cells = side * side
+        self.box, self.side, self.cells = box, side, cells
+        self.symbols = SYMBOLS[:side]
+        self.all_candidates = (1 << side) - 1
+        if side == 9:
+            self.popcount = POPCOUNT
+        elif side <= 16:
+            self.popcount = tuple(mask.bit_count() for mask in range(1 << side))
+        else:
+            self.popcount = BitCount()
+        self.rows = tuple(tuple(row * side + col for col in range(side)) for row in range(side))
+        self.cols = tuple(tuple(row * side + col for row in range(side)) for col in range(side))
+        self.blks = tuple(tuple((blk // box * box + row) * side + blk % box * box + col for row in range(box) for col in range(box))
+                          for blk in range(side))
+        self.units = self.rows + self.cols + self.blks
+        self.unit_entity = tuple((entity_type, ent_id) for entity_type in Entity for ent_id in range(1, side + 1))
+        self.unit_names = tuple(entity_type.name for entity_type, _ in self.unit_entity)
+        self.cell_row = tuple(idx // side + 1 for idx in range(cells))
+        self.cell_col = tuple(idx % side + 1 for idx in range(cells))
+        self.cell_blk = tuple(idx // (side * box) * box + idx % side // box + 1 for idx in range(cells))
+        self.cell_id = tuple(f"r{self.cell_row[idx]}c{self.cell_col[idx]}_b{self.cell_blk[idx]}" for idx in range(cells))
+        self.cell_units = tuple((self.cell_row[idx] - 1, side - 1 + self.cell_col[idx], 2 * side - 1 + self.cell_blk[idx]) for idx in range(cells))
+        self.peers = tuple(tuple(sorted(set().union(*(self.units[unit] for unit in self.cell_units[idx])) - {idx})) for idx in range(cells))
+        # For each block: its row lines then its column lines, as (line unit, cells inside the block, cells outside the block).
+        self.blk_lines = tuple(tuple(tuple(self.split_line(line, blk) for line in sorted(set(self.cell_units[idx][axis] for idx in self.units[blk])))
+                                     for axis in (0, 1))
+                               for blk in range(2 * side, 3 * side))
+
+    def split_line(self, line, blk):
+        inside = set(self.units[blk])
+        return (line, tuple(c for c in self.units[line] if c in inside), tuple(c for c in self.units[line] if c not in inside))
+
+    def mask_values(self, mask):
+        return tuple(self.symbols[v] for v in range(self.side) if mask >> v & 1)
+
+    def line(self, values):
+        return ''.join(self.symbols[value - 1] if value else '_' for value in values)
+
+
+BOARDS = {}
+
+
+def board_for(box):
+    if box not in BOARDS:
+        BOARDS[box] = Board(box)
+    return BOARDS[box]
+
+
+def parse_puzzle(puzzle_str):
+    # Returns (board, values) for a puzzle given as one character per cell, with 1-9 then A-P (or a-p) for
+    # values and _ . 0 for blanks, or as whitespace-separated cells, where values may also be decimal numbers.
+    # The board size follows from the number of cells.
+    if isinstance(puzzle_str, (bytes, bytearray, memoryview)):
+        puzzle_str = bytes(puzzle_str).decode('ascii')
+    cells = puzzle_str.split()
+    if len(cells) == 1:
+        cells = cells[0]
+    box = round(len(cells) ** 0.25)
+    if box < 2 or box > 5 or box ** 4 != len(cells):
+        raise ValueError(f"puzzle must have 16, 81, 256 or 625 cells, got {len(cells)}")
+    board = board_for(box)
+    values = []
+    for cell in cells:
+        if cell in blank_values:
+            values.append(0)
+        elif cell.isdigit() and 1 <= int(cell) <= board.side:
+            values.append(int(cell))
+        elif len(cell) == 1 and cell.upper() in board.symbols:
+            values.append(board.symbols.index(cell.upper()) + 1)
+        else:
+            raise ValueError(f"invalid cell value: {cell}")
+    return board, values
+
+
+BOARD = board_for(3)
+ROWS, COLS, BLKS, UNITS = BOARD.rows, BOARD.cols, BOARD.blks, BOARD.units
+UNIT_ENTITY, UNIT_NAMES = BOARD.unit_entity, BOARD.unit_names
+CELL_ROW, CELL_COL, CELL_BLK, CELL_ID = BOARD.cell_row, BOARD.cell_col, BOARD.cell_blk, BOARD.cell_id
+CELL_UNITS, PEERS, BLK_LINES = BOARD.cell_units, BOARD.peers, BOARD.blk_lines
+
+
+def search_solutions(candidates, limit=1, board=BOARD):
+    # Depth-first search over a copy of the candidate masks, branching on the cell with the fewest
+    # candidates. Every change is pushed onto a trail so a failed branch is undone by popping it.
+    # Boards wider than 9x9 also propagate hidden singles; naked singles alone leave their search
+    # too wide to finish.
+    cands = list(candidates)
+    peers = board.peers
+    popcount = board.popcount
+    units = board.units if board.side > 9 else ()
+    all_candidates = board.all_candidates
+    trail = []
+    solutions = []
+
+    def assign(idx, bit):
+        pending = [(idx, bit)]
+        while pending:
+            idx, bit = pending.pop()
+            if not cands[idx] & bit:
+                return False
+            if cands[idx] != bit:
+                trail.append((idx, cands[idx]))
+                cands[idx] = bit
+            for peer in peers[idx]:
+                mask = cands[peer]
+                if mask & bit:
+                    if mask == bit:
+                        return False
+                    trail.append((peer, mask))
+                    cands[peer] = mask ^ bit
+                    if popcount[mask ^ bit] == 1:
+                        pending.append((peer, mask ^ bit))
+        return True
+
+    def undo(mark):
+        while len(trail) > mark:
+            idx, mask = trail.pop()
+            cands[idx] = mask
+
+    def hidden_singles():
+        changed = True
+        while changed:
+            changed = False
+            for unit in units:
+                once = twice = 0
+                for idx in unit:
+                    mask = cands[idx]
+                    twice |= once & mask
+                    once |= mask
+                if once != all_candidates:
+                    return False
+                single = once & ~twice
+                while single:
+                    bit = lowest_bit(single)
+                    single ^= bit
+                    for idx in unit:
+                        if cands[idx] & bit:
+                            if cands[idx] != bit:
+                                if not assign(idx, bit):
+                                    return False
+                                changed = True
+                            break
+        return True
+
+    def dfs():
+        if units and not hidden_singles():
+            return False
+        best, best_count = None, board.side + 1
+        for idx, mask in enumerate(cands):
+            count = popcount[mask]
+            if count == 0:
+                return False
+            if 1 < count < best_count:
+                best, best_count = idx, count
+                if count == 2:
+                    break
+        if best is None:
+            solutions.append(list(cands))
+            return len(solutions) >= limit
+        mask = cands[best]
+        while mask:
+            bit = lowest_bit(mask)
+            mask ^= bit
+            mark = len(trail)
+            if assign(best, bit) and dfs():
+                return True
+            undo(mark)
+        return False
+
+    for idx, mask in enumerate(candidates):
+        if popcount[mask] == 1 and not assign(idx, mask):
+            return solutions
+    dfs()
+    return solutions
+
+
+def count_solutions(candidates, limit=2, board=BOARD):
+    return len(search_solutions(candidates, limit, board))
+
+
+def solve(puzzle, search=True, stats=False, trace=False, max_loops=None, time_budget=None):
+    # Solves a str or bytes puzzle, in any format parse_puzzle reads, entirely in memory and returns a SolveResult.
+    return SudokuSolver.from_string(puzzle, search=search, stats=stats, trace=trace, max_loops=max_loops, time_budget=time_budget).result()
+
+
+# Trace events are (step, kind, cell index, value, strategy id, detail) tuples. step is the solve loop,
+# and detail is the unit index for unit strategies, a packed line set for fish, and -1 otherwise.
+# Events only make sense against the board they came from, so formatting them takes the board.
+ELIMINATION, PLACEMENT = 0, 1
+TRACE_STRATEGIES = ('row', 'col', 'blk', 'only_one_cell_left', 'only_one_value_left',
+                    'hidden_double', 'hidden_triple', 'hidden_quadruple', 'naked_double', 'naked_triple', 'naked_quadruple',
+                    'vector_beyond_blk', 'vectors_within_blk', 'x_wing', 'swordfish', 'jellyfish', 'search')
+STRATEGY_IDS = {name: strategy_id for strategy_id, name in enumerate(TRACE_STRATEGIES)}
+FISH_NAMES = {2: 'x_wing', 3: 'swordfish', 4: 'jellyfish'}
+HIDDEN_NAMES = {2: 'hidden_double', 3: 'hidden_triple', 4: 'hidden_quadruple'}
+NAKED_NAMES = {2: 'naked_double', 3: 'naked_triple', 4: 'naked_quadruple'}
+
+
+def fish_detail(base_type, base_lines, cover_lines, side=9):
+    return base_lines | cover_lines << side | (base_type is Entity.col) << (2 * side)
+
+
+def format_event(event, board=BOARD, strategies=TRACE_STRATEGIES):
+    step, kind, idx, value, strategy_id, detail = event
+    strategy = strategies[strategy_id]
+    side = board.side
+    if strategy in ('only_one_cell_left', 'only_one_value_left'):
+        entity_type, ent_id = board.unit_entity[detail]
+        label = f"{strategy} in {entity_type.name}:{ent_id}" if strategy == 'only_one_cell_left' else f"{strategy} {entity_type.name}:{ent_id}"
+    elif strategy in ('x_wing', 'swordfish', 'jellyfish'):
+        base_name, cover_name = ('col', 'row') if detail >> (2 * side) else ('row', 'col')
+        bases = [line + 1 for line in range(side) if detail >> line & 1]
+        covers = [line + 1 for line in range(side) if detail >> (line + side) & 1]
+        label = f"{strategy}: {base_name}s {bases} {cover_name}s {covers}"
+    else:
+        label = strategy
+    cell = f"r{board.cell_row[idx]}c{board.cell_col[idx]}"
+    if kind == PLACEMENT:
+        return f"\tSOLVED: {cell} = {board.symbols[value - 1]} ({label})"
+    return f"\tIMPOSSIBLE: {cell} != {board.symbols[value - 1]} ({label})"
+
+
+class SolveTrace:
+    # Records solve events into a preallocated list that doubles when full. Nothing is formatted
+    # until the trace is read with messages(), to_jsonl() or to_bytes(). Events hold strategy ids into
+    # strategies, the names of the solver class that recorded them, and the binary format stores those
+    # names after its header so a trace reads back the same in a process that registered other strategies.
+    record_format = struct.Struct('<IBHBBq')
+    header_format = struct.Struct('<4sIBH')
+    magic = b'SDT4'
+
+    def __init__(self, capacity=1024, board=BOARD, strategies=TRACE_STRATEGIES):
+        self.events = [None] * capacity
+        self.size = 0
+        self.board = board
+        self.strategies = strategies
+
+    def record(self, event):
+        if self.size == len(self.events):
+            self.events.extend([None] * max(len(self.events), 1))
+        self.events[self.size] = event
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.events[:self.size])
+
+    def messages(self):
+        return [format_event(event, self.board, self.strategies) for event in self]
+
+    def to_jsonl(self, stream):
+        stream.write(json.dumps({'box': self.board.box}) + '\n')
+        for step, kind, idx, value, strategy_id, detail in self:
+            stream.write(json.dumps({'step': step, 'kind': 'placement' if kind == PLACEMENT else 'elimination', 'cell': idx,
+                                     'value': value, 'strategy': self.strategies[strategy_id], 'detail': detail}) + '\n')
+
+    @classmethod
+    def from_jsonl(cls, stream, board=BOARD):
+        # The first line gives the board size, like the binary header. Traces written without it are read on board.
+        trace = cls(board=board)
+        for line in stream:
+            if line.strip():
+                event = json.loads(line)
+                if 'step' not in event:
+                    trace.board = board_for(event['box'])
+                    continue
+                if event['strategy'] not in trace.strategies:
+                    trace.strategies += (event['strategy'],)
+                trace.record((event['step'], PLACEMENT if event['kind'] == 'placement' else ELIMINATION, event['cell'],
+                              event['value'], trace.strategies.index(event['strategy']), event['detail']))
+        return trace
+
+    def to_bytes(self):
+        names = '\n'.join(self.strategies).encode('ascii')
+        header = self.header_format.pack(self.magic, self.size, self.board.box, len(names))
+        return header + names + b''.join(self.record_format.pack(*event) for event in self)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != cls.magic:
+            raise ValueError("not a solve trace")
+        _, size, box, names_size = cls.header_format.unpack_from(data)
+        start = cls.header_format.size + names_size
+        trace = cls(size, board_for(box), tuple(bytes(data[cls.header_format.size:start]).decode('ascii').split('\n')))
+        for event in cls.record_format.iter_unpack(data[start:start + size * cls.record_format.size]):
+            trace.record(event)
+        return trace
+
+    def replay(self, puzzle):
+        # Applies the events in order to the puzzle's starting candidates, yielding each event with
+        # the live candidate list after it has been applied.
+        board, values = parse_puzzle(puzzle)
+        candidates = [1 << (value - 1) if value else board.all_candidates for value in values]
+        for event in self:
+            bit = 1 << (event[3] - 1)
+            candidates[event[2]] = bit if event[1] == PLACEMENT else candidates[event[2]] & ~bit
+            yield (event, candidates)
 
 
 class SudokuSolver:
 
     def __init__(self, args=[]):
+        import argparse
         argv = args if args else sys.argv[1::]
         parser = argparse.ArgumentParser(argv)
         parser.add_argument('--puzzle-file-path', type=str, required=True)
         parser.add_argument('--display-unsolved-puzzle', action='store_true')
         parser.add_argument('--silent', action='store_true')
+        parser.add_argument('--no-search', dest='search', action='store_false')
+        parser.add_argument('--count-solutions', action='store_true')
+        parser.add_argument('--stats', dest='show_stats', action='store_true')
+        parser.add_argument('--trace-file', type=str, help="write the solve trace here, as JSONL for *.jsonl paths and binary otherwise")
+        parser.add_argument('--max-loops', type=int, help="stop after this many rounds of the strategy tiers")
+        parser.add_argument('--time-budget-ms', type=float, help="stop solving after this many milliseconds")
         parser.parse_args(argv, self)
+        self.time_budget = self.time_budget_ms / 1000 if self.time_budget_ms is not None else None
+        self.show_boards = True
+        self.stats = None
+        self.trace = None
 
         self.import_puzzle()
+        if self.count_solutions:
+            solution_count = self.solution_count()
+            print(f"Solution Count: {solution_count}{'+' if solution_count > 1 else ''}")
+        if self.show_stats:
+            self.enable_stats()
+        if self.trace_file:
+            self.enable_trace()
         if self.display_unsolved_puzzle is False:
             self.solve_puzzle()
+        if self.show_stats:
+            print(self.stats_report())
+        if self.trace_file:
+            self.write_trace(self.trace_file)
+
+    @classmethod
+    def from_string(cls, puzzle_str, solve=True, search=True, stats=False, trace=False, max_loops=None, time_budget=None):
+        # Builds a silent solver from an in-memory str or bytes puzzle line, without argparse, file reads or printing.
+        # time_budget is in seconds; max_loops and time_budget stop the solve early, skipping search.
+        solver = cls.__new__(cls)
+        solver.puzzle_file_path = None
+        solver.display_unsolved_puzzle = not solve
+        solver.silent = True
+        solver.show_boards = False
+        solver.search = search
+        solver.max_loops = max_loops
+        solver.time_budget = time_budget
+        solver.stats = None
+        solver.trace = None
+        solver.import_puzzle(puzzle_str)
+        if stats:
+            solver.enable_stats()
+        if trace:
+            solver.enable_trace()
+        if solve:
+            solver.solve_puzzle()
+        return solver
 
     class PuzzleSolved(Exception):
         pass
 
+    class SearchRestart(Exception):
+        pass
+
+    # Guesses the search on boards wider than 9x9 may make before it first restarts. Later restarts allow
+    # this many times the next term of luby(), so short runs stay frequent while long ones keep getting longer.
+    search_nodes = 64
+
+    strategy_names = ('impossible_in_entity',
+                      'solve_for_values_with_only_one_cell_left',
+                      'solve_for_cells_with_only_one_value_left',
+                      'shared_hidden_values',
+                      'shared_naked_values',
+                      'check_vector_beyond_blk',
+                      'check_subvectors_within_blk',
+                      'fish',
+                      'search_remaining_cells')
+    # Names that trace events refer to by id. register_strategy extends them for its class.
+    trace_strategies = TRACE_STRATEGIES
+    strategy_ids = STRATEGY_IDS
+
+    # The scheduler runs strategies a tier at a time, cheapest first, and goes back to tier 0 as soon as a
+    # strategy in a higher tier makes progress, so the costly tiers only see boards the cheap ones are stuck
+    # on. Within a tier strategies run in cost order. scope is 'unit' (called with each changed unit),
+    # 'blk' (changed blocks only) or 'board' (called with no arguments when anything has changed).
+    strategies = (Strategy('solve_for_values_with_only_one_cell_left', 0, 1, 'unit'),
+                  Strategy('solve_for_cells_with_only_one_value_left', 0, 1, 'unit'),
+                  Strategy('check_vector_beyond_blk', 1, 2, 'blk'),
+                  Strategy('check_subvectors_within_blk', 1, 2, 'blk'),
+                  Strategy('shared_naked_values', 1, 3, 'unit'),
+                  Strategy('shared_hidden_values', 1, 4, 'unit'),
+                  Strategy('fish_sweep', 2, 10, 'board'))
+
+    @classmethod
+    def register_strategy(cls, name, tier, cost, scope='unit'):
+        # Adds the method called name to the schedule of cls and its subclasses. Eliminations and placements
+        # it makes are traced under its own name unless it passes one of TRACE_STRATEGIES. The name gets an
+        # id in the trace names of cls and its subclasses only, so other classes' traces are unaffected.
+        cls.strategies = tuple(sorted(cls.strategies + (Strategy(name, tier, cost, scope),), key=lambda strategy: (strategy.tier, strategy.cost)))
+        if name not in cls.strategy_names:
+            cls.strategy_names += (name,)
+        if name not in cls.strategy_ids:
+            cls.strategy_ids = dict(cls.strategy_ids, **{name: len(cls.trace_strategies)})
+            cls.trace_strategies += (name,)
+
+    class StrategyStats:
+
+        def __init__(self):
+            self.calls = 0
+            self.seconds = 0.0
+            self.eliminations = 0
+            self.placements = 0
+
+        def as_dict(self):
+            return {'calls': self.calls, 'seconds': self.seconds, 'eliminations': self.eliminations, 'placements': self.placements}
+
+    def enable_stats(self, callback=None):
+        # Shadows each strategy method on this instance with a timed wrapper. Solvers that never call
+        # this run the plain methods, so instrumentation costs nothing unless it is switched on.
+        # callback(name, seconds, eliminations, placements) is called after every strategy invocation.
+        if self.stats is None:
+            self.stats = {name: self.StrategyStats() for name in self.strategy_names}
+            self.stats_callbacks = []
+            for name in self.strategy_names:
+                setattr(self, name, self.timed_strategy(name, getattr(self, name)))
+        if callback:
+            self.stats_callbacks.append(callback)
+
+    def timed_strategy(self, name, strategy):
+        stats = self.stats[name]
+
+        def timed(*args):
+            eliminations, placements = self.eliminations, self.placements + self.searched_cells
+            start = perf_counter()
+            try:
+                return strategy(*args)
+            finally:
+                seconds = perf_counter() - start
+                eliminations = self.eliminations - eliminations
+                placements = self.placements + self.searched_cells - placements
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.eliminations += eliminations
+                stats.placements += placements
+                for callback in self.stats_callbacks:
+                    callback(name, seconds, eliminations, placements)
+        return timed
+
+    def enable_trace(self, capacity=1024):
+        if self.trace is None:
+            self.trace = SolveTrace(capacity, self.board, self.trace_strategies)
+        return self.trace
+
+    def write_trace(self, path):
+        if path.endswith('.jsonl'):
+            with open(path, 'w') as trace_file:
+                self.trace.to_jsonl(trace_file)
+        else:
+            with open(path, 'wb') as trace_file:
+                trace_file.write(self.trace.to_bytes())
+
+    def record_events(self, kind, idx, bits, strategy, detail):
+        strategy_id = self.strategy_ids[strategy]
+        while bits:
+            bit = lowest_bit(bits)
+            bits ^= bit
+            event = (self.loops, kind, idx, bit.bit_length(), strategy_id, detail)
+            if self.trace is not None:
+                self.trace.record(event)
+            if not self.silent:
+                print(format_event(event, self.board, self.trace_strategies))
+
+    def strategy_stats(self):
+        return {name: stats.as_dict() for name, stats in self.stats.items()} if self.stats else {}
+
+    def stats_report(self):
+        lines = [f"{'Strategy':<42}{'Calls':>7}{'Time ms':>10}{'Eliminations':>14}{'Placements':>12}"]
+        for name, stats in self.strategy_stats().items():
+            lines.append(f"{name:<42}{stats['calls']:>7}{stats['seconds'] * 1000:>10.2f}{stats['eliminations']:>14}{stats['placements']:>12}")
+        return '\n'.join(lines)
+
     def solve_puzzle(self):
+        self.deadline = perf_counter() + self.time_budget if self.time_budget is not None else None
         try:
             self.loops = 0
-            self.progress_made = True
-            while self.making_progress():
-                self.set_impossible_values()
-                self.set_values()
+            self.eliminate_solved_values()
+            self.run_strategies()
+            if self.search and not self.out_of_budget:
+                self.search_remaining_cells()
         except self.PuzzleSolved:
             self.print_progress()
         self.validate_board()
-        print(self)
+        if self.show_boards:
+            print(self)
+
+    def search_remaining_cells(self):
+        if self.board.side > 9:
+            solution = self.strategy_search()
+        else:
+            solutions = search_solutions(self.candidates, board=self.board)
+            solution = solutions[0] if solutions else None
+        if solution is None:
+            if not self.silent:
+                print("\tSEARCH: stopped by the time budget" if self.out_of_budget else "\tSEARCH: no solution exists from the current candidates")
+            return
+        for idx, mask in enumerate(solution):
+            if not self.values[idx]:
+                self.values[idx] = mask.bit_length()
+                self.candidates[idx] = mask
+                self.unsolved_cell_count -= 1
+                self.searched_cells += 1
+                if self.trace is not None:
+                    self.trace.record((self.loops, PLACEMENT, idx, mask.bit_length(), self.strategy_ids['search'], -1))
+        if not self.silent:
+            print(f"\tSEARCH: filled {self.searched_cells} cells by backtracking")
+
+    def strategy_search(self):
+        # Search for boards wider than 9x9, where search_solutions' naked singles prune too little. Every guess
+        # is followed by the strategy schedule and unit matching, and the search restarts with a reshuffled
+        # branch order each time it uses up its allowance of guesses. Without these, 25x25 solve times are
+        # heavy-tailed: most puzzles finish in a fraction of a second and a few run for minutes. Returns the
+        # solved candidates, or None, leaving the solver as it was before the search.
+        silent, trace, max_loops = self.silent, self.trace, self.max_loops
+        self.silent, self.trace, self.max_loops = True, None, None
+        start = self.snapshot()
+        rng = random.Random(0)
+        restarts = 0
+        try:
+            while True:
+                restarts += 1
+                self.guesses = self.search_nodes * luby(restarts)
+                try:
+                    return self.search_node(rng)
+                except self.SearchRestart:
+                    self.restore(start)
+        finally:
+            self.restore(start)
+            self.silent, self.trace, self.max_loops = silent, trace, max_loops
+
+    def search_node(self, rng):
+        # The strategies and the unit matching feed each other, so they take turns until neither removes anything.
+        while True:
+            try:
+                self.run_strategies()
+            except self.PuzzleSolved:
+                return list(self.candidates)
+            except ValueError:
+                return None
+            if self.out_of_budget or not self.consistent():
+                return None
+            eliminations = self.eliminations
+            for unit, changes in enumerate(self.unit_changes):
+                if changes != self.unit_matched[unit]:
+                    if not self.unit_matching(unit):
+                        return None
+                    self.unit_matched[unit] = self.unit_changes[unit]
+            if self.eliminations == eliminations:
+                break
+        popcount = self.board.popcount
+        best = min((idx for idx, value in enumerate(self.values) if not value), key=lambda idx: (popcount[self.candidates[idx]], rng.random()))
+        bits = [bit for bit in (1 << value for value in range(self.board.side)) if self.candidates[best] & bit]
+        rng.shuffle(bits)
+        snapshot = self.snapshot()
+        for bit in bits:
+            self.guesses -= 1
+            if self.guesses < 0:
+                raise self.SearchRestart
+            try:
+                self.assign_cell_value(best, bit)
+                solution = self.search_node(rng)
+            except self.PuzzleSolved:
+                solution = list(self.candidates)
+            except ValueError:
+                solution = None
+            if solution is not None or self.out_of_budget:
+                return solution
+            self.restore(snapshot)
+        return None
+
+    def consistent(self):
+        # False if a cell has no candidates left or a unit has no place left for some value.
+        cands = self.candidates
+        if not all(cands):
+            return False
+        for unit in self.board.units:
+            mask = 0
+            for idx in unit:
+                mask |= cands[idx]
+            if mask != self.board.all_candidates:
+                return False
+        return True
+
+    def unit_matching(self, unit):
+        # All-different filtering (Regin): pairs each open cell of the unit with a distinct candidate, then
+        # removes every candidate that no such pairing can use. A candidate is usable if it is in the pairing
+        # found, or if the cell it is paired with can reach this cell by swapping along the pairing.
+        # Returns False if the open cells can't all get distinct values.
+        cells = [idx for idx in self.board.units[unit] if not self.values[idx]]
+        masks = [self.candidates[idx] for idx in cells]
+        cell_of_value = {}
+        value_of_cell = [0] * len(cells)
 
-    def making_progress(self):
+        def augment(pos, tried):
+            options = masks[pos] & ~tried[0]
+            while options:
+                bit = lowest_bit(options)
+                options ^= bit
+                tried[0] |= bit
+                other = cell_of_value.get(bit)
+                if other is None or augment(other, tried):
+                    cell_of_value[bit] = pos
+                    value_of_cell[pos] = bit
+                    return True
+            return False
+        for pos in range(len(cells)):
+            if not augment(pos, [0]):
+                return False
+        # successors[pos] holds the cells paired with pos's other candidates, as a bitset of positions.
+        successors = []
+        for pos, mask in enumerate(masks):
+            others = mask ^ value_of_cell[pos]
+            reach = 0
+            while others:
+                bit = lowest_bit(others)
+                others ^= bit
+                reach |= 1 << cell_of_value[bit]
+            successors.append(reach)
+        reachable = []
+        for pos in range(len(cells)):
+            seen = frontier = successors[pos]
+            while frontier:
+                step = 0
+                while frontier:
+                    low = lowest_bit(frontier)
+                    frontier ^= low
+                    step |= successors[low.bit_length() - 1]
+                frontier = step & ~seen
+                seen |= step
+            reachable.append(seen)
+        for pos, mask in enumerate(masks):
+            others = mask ^ value_of_cell[pos]
+            unusable = 0
+            while others:
+                bit = lowest_bit(others)
+                others ^= bit
+                if not reachable[cell_of_value[bit]] >> pos & 1:
+                    unusable |= bit
+            if unusable:
+                self.assign_cell_impossible_value(cells[pos], unusable)
+        return True
+
+    def snapshot(self):
+        unit_seen, board_seen = self.tier_seen
+        return (list(self.candidates), list(self.values), list(self.unit_changes), list(self.unit_matched), [list(seen) for seen in unit_seen],
+                list(board_seen), self.unsolved_cell_count, self.board_changes, self.loops, self.eliminations, self.placements)
+
+    def restore(self, snapshot):
+        candidates, values, unit_changes, unit_matched, unit_seen, board_seen, *counters = snapshot
+        self.candidates[:], self.values[:], self.unit_changes[:], self.unit_matched[:] = candidates, values, unit_changes, unit_matched
+        self.tier_seen = ([list(seen) for seen in unit_seen], list(board_seen))
+        self.unsolved_cell_count, self.board_changes, self.loops, self.eliminations, self.placements = counters
+
+    def solution_count(self, limit=2):
+        return count_solutions(self.candidates, limit, self.board)
+
+    def schedule(self):
+        # Groups the strategies by tier as (unit strategies, board strategies), binding each method now so
+        # wrappers installed by enable_stats are the ones called.
+        tiers = {}
+        for strategy in self.strategies:
+            unit_strategies, board_strategies = tiers.setdefault(strategy.tier, ([], []))
+            method = getattr(self, strategy.name)
+            if strategy.scope == 'board':
+                board_strategies.append(method)
+            else:
+                unit_strategies.append((2 * self.board.side if strategy.scope == 'blk' else 0, method))
+        return [tiers[tier] for tier in sorted(tiers)]
+
+    def run_strategies(self):
+        # Each tier remembers the change count of every unit, and of the board, as of its last visit, and
+        # only revisits what has changed since.
+        # The visits are kept on the solver, so a search that runs the strategies again after each guess
+        # only revisits the units the guess changed.
+        tiers = self.schedule()
+        unit_count = len(self.board.units)
+        if self.tier_seen is None:
+            self.tier_seen = ([[-1] * unit_count for _ in tiers], [-1] * len(tiers))
+        unit_seen, board_seen = self.tier_seen
+        tier = 0
+        self.start_loop()
+        while tier < len(tiers):
+            if self.budget_spent(self.loops):
+                return
+            unit_strategies, board_strategies = tiers[tier]
+            seen = unit_seen[tier]
+            progress = self.eliminations + self.placements
+            for unit in range(unit_count):
+                if seen[unit] == self.unit_changes[unit]:
+                    continue
+                seen[unit] = self.unit_changes[unit]
+                self.unit_visits += 1
+                for first_unit, method in unit_strategies:
+                    if unit >= first_unit:
+                        method(unit)
+                        if tier and self.eliminations + self.placements != progress:
+                            break
+                if tier and self.eliminations + self.placements != progress:
+                    # The unit's remaining strategies haven't run, so it stays pending in this tier.
+                    seen[unit] = -1
+                    break
+            else:
+                if board_seen[tier] != self.board_changes:
+                    board_seen[tier] = self.board_changes
+                    for method in board_strategies:
+                        method()
+                        if self.eliminations + self.placements != progress:
+                            break
+            if self.eliminations + self.placements == progress:
+                tier += 1
+            elif tier:
+                tier = 0
+                if self.budget_spent(self.loops + 1):
+                    return
+                self.start_loop()
+
+    def start_loop(self):
         self.loops += 1
         self.print_progress()
-        enter_loop = self.progress_made
-        self.progress_made = False
-        return enter_loop
+
+    def budget_spent(self, loops):
+        if self.max_loops is not None and loops > self.max_loops or self.deadline is not None and perf_counter() > self.deadline:
+            self.out_of_budget = True
+            if not self.silent:
+                print(f"\tBUDGET: stopped after {self.loops} loops")
+        return self.out_of_budget
 
     def print_progress(self):
         if not self.silent:
-            print(f"Current Loop: {self.loops}  Remaining Cells: {self.unsolved_cell_count}")
-
-    def import_puzzle(self):
-        self.puzzle = []
-        self.puzzle_by_id = {}
-        self.puzzle_by_row = defaultdict(list)
-        self.puzzle_by_col = defaultdict(list)
-        self.puzzle_by_blk = defaultdict(list)
-        self.puzzle_ent = {Entity.row: self.puzzle_by_row, Entity.col: self.puzzle_by_col, Entity.blk: self.puzzle_by_blk}
-        self.unsolved_cell_count = 0
-
-        file_str = open(self.puzzle_file_path, 'r').read().strip()
-        for idx, char in enumerate(file_str):
-            cell = self.SudokuCell(char, idx)
-            self.puzzle.append(cell)
-            self.puzzle_by_id[f"{cell.row}{cell.col}"] = cell
-            self.puzzle_by_row[cell.row].append(cell)
-            self.puzzle_by_col[cell.col].append(cell)
-            self.puzzle_by_blk[cell.blk].append(cell)
-            if not cell.value:
-                self.unsolved_cell_count += 1
-        print(self.small_board())
+            print(f"Current Loop: {self.loops}  Remaining Cells: {self.unsolved_cell_count}  "
+                  f"Eliminations: {self.eliminations}  Unit Visits: {self.unit_visits}")
+
+    def import_puzzle(self, puzzle_str=None):
+        if puzzle_str is None:
+            puzzle_str = open(self.puzzle_file_path, 'r').read()
+        elif isinstance(puzzle_str, (bytes, bytearray, memoryview)):
+            puzzle_str = bytes(puzzle_str).decode('ascii')
+        puzzle_str = puzzle_str.strip()
+        self.board, self.values = board, values = parse_puzzle(puzzle_str)
+        self.candidates = [1 << (value - 1) if value else board.all_candidates for value in values]
+        self.unsolved_cell_count = values.count(0)
+        self.eliminations = 0
+        self.placements = 0
+        self.unit_visits = 0
+        self.searched_cells = 0
+        self.loops = 0
+        self.out_of_budget = False
+        self.unit_changes = [0] * len(board.units)
+        self.board_changes = 0
+        self.tier_seen = None
+        self.unit_matched = [-1] * len(board.units)
+        self.givens = puzzle_str if len(puzzle_str) == board.cells else board.line(values)
+        self.puzzle = [self.SudokuCell(self, idx) for idx in range(board.cells)]
+        if self.show_boards:
+            print(self.small_board())
 
     class SudokuCell:
+        # A thin view over the solver's flat `values` and `candidates` arrays.
 
-        def __init__(self, value, idx):
-            if value == '_':
-                value = None
-            self._value = value
-            self.set_coordinates(idx)
-            if self._value:
-                self.impossible_values = all_values - set([self._value])
-            else:
-                self.impossible_values = set()
-
-        def set_coordinates(self, idx) -> int:
-            self.row = math.ceil((idx + 1) / 9)
-            self.col = int(str(idx / 9).split('.')[-1][0]) + 1
-            blk_col_1 = {1: 1, 2: 1, 3: 1, 4: 2, 5: 2, 6: 2, 7: 3, 8: 3, 9: 3}
-            blk_col_2 = {1: 4, 2: 4, 3: 4, 4: 5, 5: 5, 6: 5, 7: 6, 8: 6, 9: 6}
-            blk_col_3 = {1: 7, 2: 7, 3: 7, 4: 8, 5: 8, 6: 8, 7: 9, 8: 9, 9: 9}
-            blk_lookup = {1: blk_col_1,
-                          2: blk_col_1,
-                          3: blk_col_1,
-                          4: blk_col_2,
-                          5: blk_col_2,
-                          6: blk_col_2,
-                          7: blk_col_3,
-                          8: blk_col_3,
-                          9: blk_col_3}
-            self.blk = blk_lookup[self.row][self.col]
-            self.id = f"r{self.row}c{self.col}_b{self.blk}"
+        def __init__(self, solver, idx):
+            self.solver = solver
+            self.idx = idx
+            board = solver.board
+            self.row = board.cell_row[idx]
+            self.col = board.cell_col[idx]
+            self.blk = board.cell_blk[idx]
+            self.id = board.cell_id[idx]
 
         def ent(self, entity_id):
             if entity_id is Entity.row:
@@ -111,262 +834,287 @@ class SudokuSolver:
 
         @property
         def value(self):
-            return self._value
+            value = self.solver.values[self.idx]
+            return self.solver.board.symbols[value - 1] if value else None
 
         @value.setter
         def value(self, submitted_value) -> str:
-            if (submitted_value in self.impossible_values) or (submitted_value not in all_values):
+            symbols = self.solver.board.symbols
+            if not isinstance(submitted_value, str) or len(submitted_value) != 1 or submitted_value not in symbols:
                 raise ValueError(f"value: {submitted_value} is not possible")
-            self._value = submitted_value
-            self.impossible_values = all_values - set([self._value])
+            self.solver.assign_cell_value(self.idx, 1 << symbols.index(submitted_value))
+
+        @property
+        def impossible_values(self):
+            board = self.solver.board
+            return set(board.mask_values(board.all_candidates & ~self.solver.candidates[self.idx]))
 
         def possible_values(self):
-            if self._value:
-                return set([self._value])
-            else:
-                return all_values - self.impossible_values
+            return set(self.solver.board.mask_values(self.solver.candidates[self.idx]))
 
-    def set_impossible_values(self):
-        for cell in self.puzzle:
-            if cell.value:
-                continue
-            self.impossible_in_entity(cell, self.get_ent(cell.row, Entity.row), Entity.row)
-            self.impossible_in_entity(cell, self.get_ent(cell.col, Entity.col), Entity.col)
-            self.impossible_in_entity(cell, self.get_ent(cell.blk, Entity.blk), Entity.blk)
-            self.x_wing(cell)
-
-        for entity_type in Entity:
-            for ent_id in range(1, 10):
-                entity = self.get_ent(ent_id, entity_type)
-                empty_cells = [c for c in entity if c.value is None]
-                for grp, other_cells in self.get_powerset(empty_cells):
-                    self.shared_hidden_values(grp, other_cells)
-                    self.shared_naked_values(grp, other_cells)
-
-        for blk in set([cell.blk for cell in self.puzzle]):
-            self.check_vector_beyond_blk(blk)
-            self.check_subvectors_within_blk(blk)
-
-    def get_ent(self, entity_id, entity_type, empty_only=False):
-        return [cell for cell in self.puzzle_ent[entity_type][entity_id] if ((empty_only and cell.value is None) or not empty_only)]
-
-    def impossible_in_entity(self, cell, entity, entity_type):
-        for other_cell in entity:
-            if (other_cell.value is None):
-                continue
-            else:
-                self.assign_cell_impossible_value(cell, other_cell.value, entity_type.name)
-
-    def assign_cell_impossible_value(self, cell, impossible_value, message=None, print_board=False):
-        if impossible_value not in cell.impossible_values:
-            cell.impossible_values.add(impossible_value)
-            self.progress_made = True
-            if message and not self.silent:
-                print(f"\tIMPOSSIBLE: r{cell.row}c{cell.col} != {impossible_value} ({message})")
+    def eliminate_solved_values(self):
+        for unit in range(len(self.board.units)):
+            self.impossible_in_entity(unit)
+
+    def mark_dirty(self, idx):
+        for unit in self.board.cell_units[idx]:
+            self.unit_changes[unit] += 1
+        self.board_changes += 1
+
+    def empty_cells(self, cells):
+        values = self.values
+        return [idx for idx in cells if not values[idx]]
+
+    def solved_mask(self, cells):
+        mask = 0
+        for idx in cells:
+            if self.values[idx]:
+                mask |= self.candidates[idx]
+        return mask
+
+    def impossible_in_entity(self, unit):
+        cells = self.board.units[unit]
+        solved_mask = self.solved_mask(cells)
+        if solved_mask:
+            for idx in self.empty_cells(cells):
+                self.assign_cell_impossible_value(idx, solved_mask, self.board.unit_names[unit], unit)
+
+    def assign_cell_impossible_value(self, idx, impossible_bits, strategy=None, detail=-1, print_board=False):
+        removed = self.candidates[idx] & impossible_bits
+        if removed:
+            self.candidates[idx] ^= removed
+            self.eliminations += self.board.popcount[removed]
+            self.mark_dirty(idx)
+            if strategy and (self.trace is not None or not self.silent):
+                self.record_events(ELIMINATION, idx, removed, strategy, detail)
             if print_board and not self.silent:
                 print(self)  # To help develop new logic to solve harder puzzles
 
-    def x_wing(self, cell):
-        if cell.value or 9 in (cell.row, cell.col):
-            return
-        for value_intersection, x_list, outer_empty_cells in self.x_sets(cell):
-            message = f"x_wing: {sorted([c.id for c in x_list])}"
-            for c in outer_empty_cells:
-                self.assign_cell_impossible_value(c, value_intersection, message)
-
-    def x_sets(self, top_left):
-        empty_cells_in_col = (c for c in self.get_ent(top_left.col, Entity.col, empty_only=True) if c.row > top_left.row)
-        empty_cells_in_row = [c for c in self.get_ent(top_left.row, Entity.row, empty_only=True) if c.col > top_left.col]
-        for bottom_left in empty_cells_in_col:
-            for top_right in empty_cells_in_row:
-                bottom_right = self.puzzle_by_id[f"{bottom_left.row}{top_right.col}"]
-                if bottom_right.value:
-                    continue
-                x_list = sorted([top_left, bottom_left, top_right, bottom_right], key=lambda x: len(x.possible_values()))
-                if len(x_list[0].possible_values()) != 2:
-                    continue
-                if len(x_list[1].possible_values()) != 2:
-                    continue
-                if x_list[0].row is not x_list[1].row and x_list[0].col is not x_list[1].col:
-                    continue
-                value_intersection = set.intersection(*[c.possible_values() for c in x_list])
-                if len(value_intersection) != 1:
-                    continue
-                value_intersection = value_intersection.pop()
-                x_ids = [c.id for c in x_list]
-
-                rows_candidates = [c for c in self.get_ent(top_left.row, Entity.row, empty_only=True) if c.id not in x_ids and value_intersection in c.possible_values()]
-                [rows_candidates.append(c) for c in self.get_ent(bottom_left.row, Entity.row, empty_only=True) if c.id not in x_ids and value_intersection in c.possible_values()]
-                cols_candidates = [c for c in self.get_ent(top_left.col, Entity.col, empty_only=True) if c.id not in x_ids and value_intersection in c.possible_values()]
-                [cols_candidates.append(c) for c in self.get_ent(bottom_right.col, Entity.col, empty_only=True) if c.id not in x_ids and value_intersection in c.possible_values()]
+    def fish_sweep(self):
+        # For each value, row_positions[v][row] holds the columns where v is still possible in that row
+        # and col_positions[v][col] the rows where it is possible in that column.
+        board = self.board
+        side = board.side
+        row_positions = [[0] * side for _ in range(side)]
+        col_positions = [[0] * side for _ in range(side)]
+        for idx, mask in enumerate(self.candidates):
+            if self.values[idx]:
+                continue
+            row, col = board.cell_row[idx] - 1, board.cell_col[idx] - 1
+            while mask:
+                bit = lowest_bit(mask)
+                mask ^= bit
+                value = bit.bit_length() - 1
+                row_positions[value][row] |= 1 << col
+                col_positions[value][col] |= 1 << row
+        for value in range(side):
+            self.fish(1 << value, row_positions[value], Entity.row, board.cols)
+            self.fish(1 << value, col_positions[value], Entity.col, board.rows)
 
-                if not cols_candidates and rows_candidates:
-                    yield (value_intersection, x_list, rows_candidates)
-                elif not rows_candidates and cols_candidates:
-                    yield (value_intersection, x_list, cols_candidates)
+    def fish(self, bit, base_positions, base_type, cover_lines):
+        # For strategy explanation, see https://www.sudokuwiki.org/Sword_Fish_Strategy
+        # n base lines whose positions for a value fall in exactly n cover lines (x_wing, swordfish,
+        # jellyfish) remove that value from the rest of the cover lines.
+        popcount = self.board.popcount
+        lines = [line for line, positions in enumerate(base_positions) if popcount[positions] >= 2]
+        for grp, cover in self.bounded_subsets([base_positions[line] for line in lines], min(4, len(lines) - 1)):
+            base_lines = 0
+            for i in grp:
+                base_lines |= 1 << lines[i]
+            detail = fish_detail(base_type, base_lines, cover, self.board.side)
+            for cover_line in range(self.board.side):
+                if not cover >> cover_line & 1:
+                    continue
+                for base_line, idx in enumerate(cover_lines[cover_line]):
+                    if not base_lines >> base_line & 1 and not self.values[idx]:
+                        self.assign_cell_impossible_value(idx, bit, FISH_NAMES[len(grp)], detail)
 
-    def shared_hidden_values(self, grp, other_cells):
+    def shared_hidden_values(self, unit):
         # For strategy explanation, see https://www.learn-sudoku.com/hidden-pairs.html
-        grp_size = {2: "double", 3: "triple", 4: "quadruple"}
-        if len(other_cells) == 0:
-            outside_values = set()
-        else:
-            outside_values = set.union(*[cell.possible_values() for cell in other_cells])
-        for combo in combinations(grp, 2):
-            value_intersection = set.intersection(*[cell.possible_values() - outside_values for cell in combo])
-            if len(value_intersection) >= len(grp):
-                shared_hidden_group = [c for c in combo]
-                last_grp_members = [c for c in grp if c not in combo]
-                for c in last_grp_members:
-                    mbr_intersect = value_intersection.intersection(c.possible_values())
-                    if len(mbr_intersect) >= len(value_intersection) - 1:
-                        shared_hidden_group.append(c)
-                for cell in shared_hidden_group:
-                    for value in outside_values:
-                        self.assign_cell_impossible_value(cell, value, f"hidden_{grp_size[len(shared_hidden_group)]}")
-
-    def shared_naked_values(self, grp, other_cells):
+        cands = self.candidates
+        empty_cells = self.empty_cells(self.board.units[unit])
+        unit_values = 0
+        for idx in empty_cells:
+            unit_values |= cands[idx]
+        value_bits = []
+        value_positions = []
+        while unit_values:
+            bit = lowest_bit(unit_values)
+            unit_values ^= bit
+            value_bits.append(bit)
+            value_positions.append(sum(1 << pos for pos, idx in enumerate(empty_cells) if cands[idx] & bit))
+        for grp, position_union in self.bounded_subsets(value_positions, min(4, len(empty_cells) - 1)):
+            grp_values = 0
+            for i in grp:
+                grp_values |= value_bits[i]
+            for pos, idx in enumerate(empty_cells):
+                if position_union >> pos & 1:
+                    self.assign_cell_impossible_value(idx, self.board.all_candidates & ~grp_values, HIDDEN_NAMES[len(grp)])
+
+    def shared_naked_values(self, unit):
         # For strategy explanation, see: https://www.learn-sudoku.com/naked-pairs.html
-        grp_size = {2: "double", 3: "triple", 4: "quadruple"}
-        value_union = set.union(*[cell.possible_values() for cell in grp])
-        for c in other_cells:
-            if c.possible_values().issubset(value_union):
-                return  # a future set will include this other_cell as a grp member
-        if len(value_union) == len(grp):
-            for cell in other_cells:
-                for value in value_union:
-                    self.assign_cell_impossible_value(cell, value, f"naked_{grp_size[len(grp)]}")
-
-    def get_powerset(self, empty_cells):
-        for grp in self.powerset(empty_cells):
-            if len(grp) not in (2, 3, 4):
-                continue
-            other_cells = [c for c in empty_cells if c not in grp]
-            yield (grp, other_cells)
+        empty_cells = self.empty_cells(self.board.units[unit])
+        cell_values = [self.candidates[idx] for idx in empty_cells]
+        for grp, value_union in self.bounded_subsets(cell_values, min(4, len(empty_cells) - 1)):
+            for pos, idx in enumerate(empty_cells):
+                if pos not in grp:
+                    self.assign_cell_impossible_value(idx, value_union, NAKED_NAMES[len(grp)])
+
+    def bounded_subsets(self, masks, max_size):
+        # Yields every group of 2 to max_size masks whose union has exactly one bit per member.
+        # Branches are pruned as soon as their union grows past max_size bits, and masks that have more
+        # bits than that on their own are never tried.
+        popcount = self.board.popcount
+        small = [i for i, mask in enumerate(masks) if popcount[mask] <= max_size]
 
-    def powerset(self, iterable):
-        s = list(iterable)
-        return chain.from_iterable(combinations(s, r) for r in range(len(s) + 1))
+        def extend(start, grp, union):
+            for pos in range(start, len(small)):
+                i = small[pos]
+                grp_union = union | masks[i]
+                count = popcount[grp_union]
+                if count > max_size:
+                    continue
+                subset = grp + (i,)
+                if len(subset) >= 2 and count == len(subset):
+                    yield (subset, grp_union)
+                elif len(subset) < max_size:
+                    yield from extend(pos + 1, subset, grp_union)
+        return extend(0, (), 0)
+
+    def vector_possibilities(self, blk, axis):
+        cands = self.candidates
+        empty_vectors_possibilities = []
+        for line, inside, outside in self.board.blk_lines[blk - 2 * self.board.side][axis]:
+            cells = self.empty_cells(inside)
+            mask = 0
+            for idx in cells:
+                mask |= cands[idx]
+            empty_vectors_possibilities.append((mask, cells, outside))
+        return empty_vectors_possibilities
 
     def check_vector_beyond_blk(self, blk):
-        all_blk_cells = self.get_ent(blk, Entity.blk)
-        solved_blk_values = set([c.value for c in all_blk_cells if c.value])
-        blk_cells_without_values = [c for c in all_blk_cells if c.value is None]
-        if len(blk_cells_without_values) == 0:
-            return
-        for entity_type in [Entity.row, Entity.col]:
-            e_range = set([c.ent(entity_type) for c in all_blk_cells if c.value is None])
-            empty_vectors_possibilities = {v: set([]) for v in e_range}
-            for c in blk_cells_without_values:
-                empty_vectors_possibilities[c.ent(entity_type)].update(c.possible_values())
-            for vector, possibilities in empty_vectors_possibilities.items():
-                other_possibilities = set()
-                for other_vect, other_pos in empty_vectors_possibilities.items():
+        for axis in (0, 1):
+            empty_vectors_possibilities = self.vector_possibilities(blk, axis)
+            for vector, (possibilities, _, outside) in enumerate(empty_vectors_possibilities):
+                other_possibilities = 0
+                for other_vect, (other_pos, _, _) in enumerate(empty_vectors_possibilities):
                     if other_vect != vector:
-                        other_possibilities.update(other_pos)
-                difference = possibilities - other_possibilities
-                cells_in_vector_beyond_blk = [c for c in self.get_ent(vector, entity_type, empty_only=True) if c.blk != blk]
-                for value in difference:
-                    for c in cells_in_vector_beyond_blk:
-                        self.assign_cell_impossible_value(c, value, message='vector_beyond_blk')
+                        other_possibilities |= other_pos
+                difference = possibilities & ~other_possibilities
+                if not difference:
+                    continue
+                for idx in self.empty_cells(outside):
+                    self.assign_cell_impossible_value(idx, difference, 'vector_beyond_blk', blk)
 
     def check_subvectors_within_blk(self, blk):
-        all_blk_cells = self.get_ent(blk, Entity.blk)
-        solved_blk_values = set([c.value for c in all_blk_cells if c.value])
-        blk_cells_without_values = [c for c in all_blk_cells if c.value is None]
-        if len(blk_cells_without_values) == 0:
-            return
-        for entity_type in [Entity.row, Entity.col]:
-            e_range = set([c.ent(entity_type) for c in all_blk_cells if c.value is None])
-            empty_vectors_possibilities = {v: [set(), []] for v in e_range}
-            for c in blk_cells_without_values:
-                empty_vectors_possibilities[c.ent(entity_type)][0].update(c.possible_values())
-                empty_vectors_possibilities[c.ent(entity_type)][1].append(c)
-            for vector, possibilities in empty_vectors_possibilities.items():
-                other_possibilities = set()
-                for other_vect, other_pos in empty_vectors_possibilities.items():
+        for axis in (0, 1):
+            empty_vectors_possibilities = self.vector_possibilities(blk, axis)
+            for vector, (possibilities, cells, _) in enumerate(empty_vectors_possibilities):
+                other_possibilities = 0
+                for other_vect, (other_pos, _, _) in enumerate(empty_vectors_possibilities):
                     if other_vect != vector:
-                        other_possibilities.update(other_pos[0])
-                values_possible_in_v_not_other = possibilities[0] - other_possibilities
-                number_possiblities_equals_number_cells = len(values_possible_in_v_not_other) == len(possibilities[1])
-                impossible_in_vector = possibilities[0] - values_possible_in_v_not_other
-                if number_possiblities_equals_number_cells:
-                    for impossible_value in impossible_in_vector:
-                        for c in possibilities[1]:
-                            self.assign_cell_impossible_value(c, impossible_value, message='vectors_within_blk')
-
-    def set_values(self):
-        for cell in self.puzzle:
-            if cell.value:
-                continue
-            for entity_type in Entity:
-                self.solve_for_values_with_only_one_cell_left(cell, entity_type)
-                self.solve_for_cells_with_only_one_value_left(cell, entity_type)
+                        other_possibilities |= other_pos
+                values_possible_in_v_not_other = possibilities & ~other_possibilities
+                if self.board.popcount[values_possible_in_v_not_other] == len(cells):
+                    impossible_in_vector = possibilities & ~values_possible_in_v_not_other
+                    for idx in cells:
+                        self.assign_cell_impossible_value(idx, impossible_in_vector, 'vectors_within_blk', blk)
 
-    def assign_cell_value(self, cell, value, msg=None):
-        cell.value = value
-        if not self.silent:
-            print(msg)
+    def assign_cell_value(self, idx, bit, strategy=None, detail=-1):
+        if not self.candidates[idx] & bit:
+            raise ValueError(f"value: {self.board.symbols[bit.bit_length() - 1]} is not possible")
+        self.values[idx] = bit.bit_length()
+        self.candidates[idx] = bit
+        if strategy and (self.trace is not None or not self.silent):
+            self.record_events(PLACEMENT, idx, bit, strategy, detail)
         self.unsolved_cell_count -= 1
-        self.progress_made = True
+        self.placements += 1
+        self.mark_dirty(idx)
         if self.puzzle_solved():
             raise self.PuzzleSolved
+        board = self.board
+        for unit in board.cell_units[idx]:
+            for other_idx in board.units[unit]:
+                if not self.values[other_idx]:
+                    self.assign_cell_impossible_value(other_idx, bit, board.unit_names[unit], unit)
 
     def puzzle_solved(self):
         return self.unsolved_cell_count == 0
 
-    def solve_for_values_with_only_one_cell_left(self, cell, entity_type):
-        entity_cells = self.get_ent(cell.ent(entity_type), entity_type)
-        unsolved_cells = [c for c in entity_cells if c.value is None]
-        entity_values = set([c.value for c in entity_cells if c.value])
-        missing_values = all_values - entity_values
-        for missing_value in missing_values:
-            cells_possibly_containing_missing_values = [c for c in unsolved_cells if missing_value in c.possible_values()]
+    def puzzle_line(self):
+        return self.board.line(self.values)
+
+    def result(self):
+        if not hasattr(self, 'valid_board'):
+            self.validate_board()
+        return SolveResult(self.givens, self.puzzle_line(), self.puzzle_solved() and self.valid_board, self.valid_board,
+                           self.loops, self.eliminations, self.placements, self.searched_cells,
+                           self.unit_visits, self.strategy_stats(), self.trace, self.out_of_budget)
+
+    def solve_for_values_with_only_one_cell_left(self, unit):
+        cands = self.candidates
+        cells = self.board.units[unit]
+        unsolved_cells = self.empty_cells(cells)
+        missing_values = self.board.all_candidates & ~self.solved_mask(cells)
+        while missing_values:
+            missing_bit = lowest_bit(missing_values)
+            missing_values ^= missing_bit
+            cells_possibly_containing_missing_values = [c for c in unsolved_cells if cands[c] & missing_bit]
             if len(cells_possibly_containing_missing_values) != 1:
                 continue
-            c = next(iter(cells_possibly_containing_missing_values))
-            msg = f"\tSOLVED: r{c.row}c{c.col} = {missing_value} (only_one_cell_left in {entity_type.name}:{cell.ent(entity_type)})"
-            self.assign_cell_value(c, missing_value, msg)
-
-    def solve_for_cells_with_only_one_value_left(self, cell, entity_type):
-        entity_cells = self.get_ent(cell.ent(entity_type), entity_type)
-        entity_values = set([c.value for c in entity_cells if c.value])
-        unsolved_cells = [c for c in entity_cells if c.value is None]
-        missing_values = all_values - entity_values
-        for c in unsolved_cells:
-            if len(c.possible_values()) == 1:
-                remaining_value = c.possible_values().pop()
-                msg = f"\tSOLVED: r{c.row}c{c.col} = {remaining_value} (only_one_value_left {entity_type.name}:{cell.ent(entity_type)})"
-                self.assign_cell_value(c, remaining_value, msg)
+            c = cells_possibly_containing_missing_values[0]
+            self.assign_cell_value(c, missing_bit, 'only_one_cell_left', unit)
+
+    def solve_for_cells_with_only_one_value_left(self, unit):
+        cands = self.candidates
+        popcount = self.board.popcount
+        for c in self.empty_cells(self.board.units[unit]):
+            if not self.values[c] and popcount[cands[c]] == 1:
+                self.assign_cell_value(c, cands[c], 'only_one_value_left', unit)
 
     def __str__(self):
-        if not self.puzzle_solved():
-            return big_board.render(self.puzzle)
+        if not self.puzzle_solved() and self.board.side == 9:
+            from big_board import big_board
+            return big_board.render_grid(self.values, self.candidates)
         else:
             return self.small_board()
 
     def small_board(self):
+        if self.board.side != 9:
+            return self.grid_board()
         # This is borrowed code from:
         """https://tio.run/##dY9dSsQwEMff9xQhsJA0g9Tt7nZd8Ca@pB/gQre2pcr2TTyBQgdBEEVF8eMInmYuUrOpKX1QmGQy//nNP0nR1KdnedB15XGmt1Gi2Q6a9U41yq5J5WQNEcSQQLrWqhSliLwAYgmJVKniJzmfFNUmr4UQlfA4YUt4TfhC@Ep4y6UdMfINmyaM2qtR4l6g9h3jAf3sA7WX1H4TfhI@cSl/5Udr@UH4RfhsZNXLd1Z@I3wnvDfyNL3QmdjkxXktpJQHVVpkOk4N6zPT7jrhA1sC810cATsENnflDNjKnXtsASy0mG@xmeX9vyJwfF@uRvsw3l8xwAPwn@fC8qF7z9KRoQPmI6vQ8uPf7WH5Aw"""
         def q(x, y): return x + y + x + y + x
         def r(a, b, c, d, e): return a + q(q(b * 3, c), d) + e + "\n"
-        print_input = tuple([0 if x is None else int(x) for x in [c.value for c in self.puzzle]])
+        print_input = tuple(self.values)
         return ((r(*"╔═╤╦╗") + q(q("║ %d │ %d │ %d " * 3 + "║\n", r(*"╟─┼╫╢")), r(*"╠═╪╬╣")) + r(*"╚═╧╩╝")) % print_input).replace(*"0 ").strip()
 
+    def grid_board(self):
+        # small_board for the other board sizes, in ASCII, with values as symbols and blanks as spaces.
+        board = self.board
+        box = board.box
+        rule = '+' + '+'.join(['-' * (2 * box + 1)] * box) + '+'
+        lines = [rule]
+        for row, cells in enumerate(board.rows, 1):
+            chars = [board.symbols[self.values[idx] - 1] if self.values[idx] else ' ' for idx in cells]
+            lines.append('| ' + ' | '.join(' '.join(chars[stack:stack + box]) for stack in range(0, board.side, box)) + ' |')
+            if row % box == 0:
+                lines.append(rule)
+        return '\n'.join(lines)
+
     def validate_board(self):
         self.valid_board = True
-        for entity_type in Entity:
-            ent_ids = set([c.ent(entity_type) for c in self.puzzle])
-            all_of_ent_type = [self.get_ent(ent_id, entity_type) for ent_id in ent_ids]
-            for ent in all_of_ent_type:
-                for cell in ent:
-                    if cell.value is None:
-                        continue
-                    ent_cells_with_value = [c for c in ent if c.value == cell.value and c.id != cell.id]
-                    if len(ent_cells_with_value) != 0:
-                        ex_c = ent_cells_with_value[0]
-                        print(f" ! THIS SOLUTION IS INCORRECT ! {ex_c.id}={ex_c.value} {cell.id}={cell.value}")
-                        self.valid_board = False
+        values = self.values
+        for ent in self.board.units:
+            for idx in ent:
+                if not values[idx]:
+                    continue
+                ent_cells_with_value = [c for c in ent if values[c] == values[idx] and c != idx]
+                if len(ent_cells_with_value) != 0:
+                    ex_c = ent_cells_with_value[0]
+                    if self.show_boards:
+                        print(f" ! THIS SOLUTION IS INCORRECT ! {self.board.cell_id[ex_c]}={values[ex_c]} {self.board.cell_id[idx]}={values[idx]}")
+                    self.valid_board = False
         if self.valid_board and not self.silent:
             print("Board Values Are Valid.")
 
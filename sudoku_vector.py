@@ -0,0 +1,98 @@
+try:
+    import numpy as np
+except ImportError as exc:
+    raise ImportError("sudoku_vector needs numpy; install it with `pip install numpy`") from exc
+from sudoku_solver import solve
+
+DIGITS = np.full(256, -1, dtype=np.int8)
+DIGITS[[ord(char) for char in '_.0']] = 0
+DIGITS[[ord(str(value)) for value in range(1, 10)]] = np.arange(1, 10)
+
+
+def parse_puzzles(lines):
+    # Returns an (N, 81) array of values, 0 for blanks, for lines that have already been checked to be 81 characters.
+    grid = DIGITS[np.frombuffer(''.join(lines).encode('ascii'), dtype=np.uint8)].reshape(len(lines), 81)
+    return grid
+
+
+def initial_candidates(grid):
+    cands = np.ones(grid.shape + (9,), dtype=bool)
+    given = grid > 0
+    cands[given] = np.arange(1, 10) == grid[given][:, None]
+    return cands
+
+
+def unit_view(cands, kind):
+    # An (N, 81, 9) candidate array as (N, unit, position in unit, value) for rows (kind 0), columns (1)
+    # or blocks (2). It is only reshapes and transposes, and applying it twice gives back cell order.
+    grid = cands.reshape(-1, 9, 9, 9)
+    if kind == 0:
+        return grid
+    if kind == 1:
+        return grid.transpose(0, 2, 1, 3)
+    return grid.reshape(-1, 3, 3, 3, 3, 9).transpose(0, 1, 3, 2, 4, 5).reshape(-1, 9, 9, 9)
+
+
+def propagate(cands):
+    # Applies naked singles (peer elimination) and hidden singles to every puzzle at once until no puzzle
+    # changes. Returns the final candidates; finished puzzles leave the working set as soon as they stop
+    # changing, whether they are solved, stuck, or contradictory.
+    cands = cands.copy()
+    active = np.arange(len(cands))
+    # The working set is kept as 0/1 bytes: einsum adds up the short value and position axes several
+    # times faster than sum() or any() on booleans.
+    work = cands.view(np.uint8)
+    while len(active):
+        count = len(work)
+        before = work
+        fixed = work * (np.einsum('ncv->nc', work) == 1)[:, :, None]
+        rows, cols, blks = (np.einsum('nupv->nuv', unit_view(fixed, kind)) for kind in range(3))
+        # Each cell's three units count every peer holding a value at least once, and the cell itself three times.
+        seen = (rows[:, :, None] + cols[:, None]).reshape(-1, 3, 3, 3, 3, 9) + blks.reshape(-1, 3, 1, 3, 1, 9)
+        work = work & (seen.reshape(count, 81, 9) == 3 * fixed)
+        hidden = np.zeros((count, 9, 9, 9), dtype=np.uint8)
+        for kind in range(3):
+            view = unit_view(work, kind)
+            hidden |= unit_view(view & (np.einsum('nupv->nuv', view) == 1)[:, :, None, :], kind)
+        hidden = hidden.reshape(count, 81, 9)
+        work = hidden | work * (np.einsum('ncv->nc', hidden) == 0)[:, :, None]
+        changed = (work != before).any(axis=(1, 2))
+        cands[active[~changed]] = work[~changed]
+        active, work = active[changed], work[changed]
+    return cands
+
+
+def solve_one(line, search=True):
+    try:
+        return solve(line, search=search).solution
+    except ValueError as exc:
+        return f"error: {exc}"
+
+
+def solve_lines(lines, search=True):
+    # Returns what sudoku_batch.solve_line returns for each line: the solution, or "error: ..." for a
+    # malformed line. Puzzles the singles don't finish, and lines that aren't 9x9 puzzles one character
+    # per cell, are handed to SudokuSolver.
+    results = [None] * len(lines)
+    valid = []
+    for index, line in enumerate(lines):
+        if isinstance(line, (bytes, bytearray, memoryview)):
+            line = bytes(line).decode('ascii')
+        line = line.strip()
+        if len(line) != 81 or not line.isascii():
+            results[index] = solve_one(line, search)
+        else:
+            valid.append((index, line))
+    if not valid:
+        return results
+    grid = parse_puzzles([line for _, line in valid])
+    bad = (grid < 0).any(axis=1)
+    cands = propagate(initial_candidates(np.where(grid < 0, 0, grid)))
+    finished = (cands.sum(axis=2) == 1).all(axis=1) & ~bad
+    values = (cands.argmax(axis=2) + 1).astype(np.uint8) + ord('0')
+    for (index, line), done, row in zip(valid, finished, values):
+        if done:
+            results[index] = row.tobytes().decode('ascii')
+        else:
+            results[index] = solve_one(line, search)
+    return results